@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+'''
+ * Walk-forward backtest of the forecasters over the quartile training history.
+ *
+ * Replays the weekly quartile series (training/train/trainingData.csv, or the train/ store of
+ * a local directory or the bucket) week by week: at every origin each model is fitted on the
+ * weeks before it and forecasts the next --horizon weeks at every quantile. Forecasters are
+ * anything quantile_forecast (shared/python/forecasters.py) accepts, the LocalForecast
+ * backend's models and its 'auto' selection. The (window, model, quantile) fits are spread
+ * over a process pool, the metrics are computed with NumPy over all windows at once:
+ *   wQL      - weighted quantile loss per quantile, as Amazon Forecast reports it
+ *   RMSE     - root mean squared error of the p50
+ *   coverage - share of the weeks a bid at the quantile forecast was at or above the actual
+ *              price, ideally the quantile itself
+ *
+ * Command: python3 Backtest.py [--root DIR | --bucket NAME] [--models auto,naive] [--quantiles 0.1,0.5,0.9]
+ *          [--horizon N] [--min-train N] [--workers N] [--by-item] [--output FILE]
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT_OF_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_OF_REPO, "shared", "python"))
+import numpy as np
+from forecasters import FORECASTERS, quantile_forecast
+from storage import LocalStorage, S3Storage
+from trainhistory import read_history, history_matrix
+
+DEFAULT_ROOT = os.path.join(ROOT_OF_REPO, "training")
+DEFAULT_MODELS = ['auto', *FORECASTERS]
+# The quantiles Amazon Forecast evaluates by default, the p50 is always included for the RMSE
+DEFAULT_QUANTILES = [0.1, 0.5, 0.9]
+DEFAULT_HORIZON = 1
+# Weeks every model is fitted on before the first window
+DEFAULT_MIN_TRAIN = 8
+WEEK = datetime.timedelta(days=7)
+
+# History of the pool's worker processes, sent once by the pool initializer instead of with every task
+HISTORY = None
+
+
+def init_worker(history):
+    global HISTORY
+    HISTORY = history
+
+
+def run_task(task):
+    # One fit: model forecasts quantile from the weeks before origin
+    origin, model, quantile, horizon = task
+    return quantile_forecast(HISTORY[:, :origin], horizon, model, quantile)
+
+
+def walk_forward(history, models, quantiles, horizon, min_train, workers):
+    # Forecasts of every model, quantile and window as one (models, quantiles, windows, items, horizon)
+    # array, and the actuals as (windows, items, horizon)
+    origins = list(range(min_train, history.shape[1] - horizon + 1))
+    if not origins:
+        raise ValueError(f'{history.shape[1]} weeks of history is too short for {min_train} training weeks and a {horizon} week horizon')
+    tasks = [(origin, model, quantile, horizon) for model in models for quantile in quantiles for origin in origins]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(history,)) as pool:
+            results = list(pool.map(run_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    else:
+        init_worker(history)
+        results = [run_task(task) for task in tasks]
+    forecasts = np.array(results).reshape(len(models), len(quantiles), len(origins), history.shape[0], horizon)
+    actuals = np.stack([history[:, origin:origin + horizon] for origin in origins])
+    return origins, forecasts, actuals
+
+
+def quantileAxes(actuals, axis):
+    # The axes of a forecasts array (leading quantile axis) matching axis of actuals
+    if axis is None:
+        return tuple(range(1, actuals.ndim + 1))
+    return tuple(a + 1 for a in (axis if isinstance(axis, tuple) else (axis,)))
+
+
+def weighted_quantile_loss(actuals, forecasts, quantiles, axis=None):
+    # 2 * sum of the pinball losses / sum of |actual|, forecasts has a leading quantile axis
+    q = np.asarray(quantiles).reshape(-1, *[1] * actuals.ndim)
+    diff = actuals - forecasts
+    loss = np.maximum(q * diff, (q - 1) * diff)
+    axes = quantileAxes(actuals, axis)
+    return 2 * loss.sum(axis=axes) / np.abs(actuals).sum(axis=axis)
+
+
+def rmse(actuals, forecasts, axis=None):
+    return np.sqrt(np.mean((actuals - forecasts) ** 2, axis=axis))
+
+
+def coverage(actuals, forecasts, axis=None):
+    # Share of the actuals at or below the forecast, per quantile
+    axes = quantileAxes(actuals, axis)
+    return np.mean(actuals <= forecasts, axis=axes)
+
+
+def evaluate(forecasts, actuals, models, quantiles, items, by_item=False):
+    # {model: metrics} over all windows, items and horizon steps, and per item with by_item.
+    # Arrays are (windows, items, horizon), per item metrics reduce over windows and steps.
+    median = quantiles.index(0.5)
+    report = {}
+    for m, model in enumerate(models):
+        predicted = forecasts[m]
+        metrics = {
+            'wQL': dict(zip(map(str, quantiles), weighted_quantile_loss(actuals, predicted, quantiles).tolist())),
+            'RMSE': float(rmse(actuals, predicted[median])),
+            'Coverage': dict(zip(map(str, quantiles), coverage(actuals, predicted).tolist())),
+        }
+        metrics['MeanWQL'] = float(np.mean(list(metrics['wQL'].values())))
+        if by_item:
+            item_wql = weighted_quantile_loss(actuals, predicted, quantiles, axis=(0, 2))
+            item_rmse = rmse(actuals, predicted[median], axis=(0, 2))
+            item_coverage = coverage(actuals, predicted, axis=(0, 2))
+            metrics['Items'] = {
+                item: {
+                    'wQL': dict(zip(map(str, quantiles), item_wql[:, i].tolist())),
+                    'RMSE': float(item_rmse[i]),
+                    'Coverage': dict(zip(map(str, quantiles), item_coverage[:, i].tolist())),
+                }
+                for i, item in enumerate(items)
+            }
+        report[model] = metrics
+    return report
+
+
+def printReport(report, quantiles):
+    names = [f'p{q * 100:g}' for q in quantiles]
+    header = f"{'model':<24}{'mean wQL':>10}" + ''.join(f'{"wQL " + n:>11}' for n in names) \
+        + f"{'RMSE':>10}" + ''.join(f'{"cov " + n:>10}' for n in names)
+    print(header)
+    for model, metrics in sorted(report.items(), key=lambda entry: entry[1]['MeanWQL']):
+        rows = [(model, metrics)] + [(f'  {item}', item_metrics) for item, item_metrics in metrics.get('Items', {}).items()]
+        for name, row in rows:
+            mean_wql = f"{row['MeanWQL']:>10.4f}" if 'MeanWQL' in row else ' ' * 10
+            print(f'{name:<24}{mean_wql}'
+                  + ''.join(f"{row['wQL'][str(q)]:>11.4f}" for q in quantiles)
+                  + f"{row['RMSE']:>10.5f}"
+                  + ''.join(f"{row['Coverage'][str(q)]:>10.2f}" for q in quantiles))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the forecasters over the quartile training history")
+    parser.add_argument('--root', default=DEFAULT_ROOT, help="directory holding train/ (default: training)")
+    parser.add_argument('--bucket', help="read train/ from this bucket instead of --root")
+    parser.add_argument('--models', default=','.join(DEFAULT_MODELS), help="comma separated models")
+    parser.add_argument('--quantiles', default=','.join(map(str, DEFAULT_QUANTILES)), help="comma separated quantiles")
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON, help="weeks forecast from every origin")
+    parser.add_argument('--min-train', type=int, default=DEFAULT_MIN_TRAIN, help="weeks before the first origin")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="processes, 1 runs in this process")
+    parser.add_argument('--by-item', action='store_true', help="also report every item_id")
+    parser.add_argument('--output', help="write the report as json to this file")
+    args = parser.parse_args()
+
+    models = args.models.split(',')
+    unknown = [model for model in models if model != 'auto' and model not in FORECASTERS]
+    if unknown:
+        parser.error(f"unknown models {', '.join(unknown)}")
+    quantiles = sorted({float(q) for q in args.quantiles.split(',')} | {0.5})
+
+    storage = S3Storage(args.bucket) if args.bucket else LocalStorage(args.root)
+    items, last, history = history_matrix(read_history(storage), WEEK)
+    print(f'{len(items)} items, {history.shape[1]} weeks up to {last:%Y-%m-%d}')
+
+    started = time.perf_counter()
+    origins, forecasts, actuals = walk_forward(history, models, quantiles, args.horizon, args.min_train, args.workers)
+    elapsed = time.perf_counter() - started
+    print(f'{len(origins)} windows x {len(models)} models x {len(quantiles)} quantiles = '
+          f'{len(origins) * len(models) * len(quantiles)} fits on {args.workers} workers in {elapsed:.2f}s\n')
+
+    report = evaluate(forecasts, actuals, models, quantiles, items, args.by_item)
+    printReport(report, quantiles)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'last_week': last.strftime('%Y-%m-%d'),
+                'windows': len(origins),
+                'horizon': args.horizon,
+                'quantiles': quantiles,
+                'seconds': elapsed,
+                'models': report,
+            }, f, indent=4)
+        print(f'\nReport written to {args.output}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+'''
+ * Micro-benchmarks of the transform hot paths.
+ *
+ * Every checked-in week under Data/Raw/Weekly is put through the ETL lambda's functions
+ * (lambdas/extracttransformload) and the shared transform core the scripts use (shared/python),
+ * with S3 replaced by an in-memory stand-in. Each case is timed over all weeks and its peak
+ * memory is measured with tracemalloc. Outputs are compared byte for byte with Data/Clean,
+ * any mismatch fails the run.
+ *
+ * Results are saved as Scripts/Benchmarking/Results/<commit>.json, pass an earlier result
+ * file with --compare to see the change per case.
+ *
+ * Command: python3 Benchmark.py [--repeat N] [--compare <result file>] [--no-save]
+'''
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+import subprocess
+import statistics
+import tracemalloc
+import contextlib
+
+ROOT_OF_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RAW_PATH = os.path.join(ROOT_OF_REPO, "Data", "Raw", "Weekly")
+CLEAN_PATH_MINUTES = os.path.join(ROOT_OF_REPO, "Data", "Clean", "Minute", "Weekly")
+CLEAN_PATH_QUARTILES = os.path.join(ROOT_OF_REPO, "Data", "Clean", "Quartiles", "Weekly")
+RESULTS_PATH = os.path.join(ROOT_OF_REPO, "Scripts", "Benchmarking", "Results")
+BUCKET = "benchmark"
+DEFAULT_REPEAT = 5
+
+# The lambda reads its bucket and region from the environment at import
+os.environ.setdefault('FORECAST_BUCKET', BUCKET)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+sys.path.insert(0, os.path.join(ROOT_OF_REPO, "lambdas", "extracttransformload"))
+sys.path.insert(0, os.path.join(ROOT_OF_REPO, "shared", "python"))
+import numpy as np
+import etl
+import pricetransform
+
+
+class InMemoryS3:
+    # The parts of the boto3 s3 client the ETL uses, backed by a dict of key -> bytes
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    class _Paginator:
+        def __init__(self, objects):
+            self.objects = objects
+
+        def paginate(self, Bucket, Prefix=''):
+            yield {'Contents': [{'Key': key, 'Size': len(body)} for key, body in sorted(self.objects.items())
+                                if key.startswith(Prefix)]}
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Body, Bucket, Key, **kwargs):
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        self.objects[Key] = Body.encode('utf-8') if isinstance(Body, str) else Body
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def get_paginator(self, name):
+        return self._Paginator(self.objects)
+
+
+class Week:
+    def __init__(self, path):
+        '''
+            One fixture week: raw records as the lambda receives them (aware datetimes) and as
+            stored on disk (iso strings), plus the expected csv outputs
+        '''
+        self.name = os.path.basename(path).split('.')[0]
+        self.start = datetime.datetime.strptime(self.name, pricetransform.FILE_NAME_TIME_FORMAT)
+        with open(path, 'r') as jf:
+            self.raw_text = json.load(jf)
+        self.raw = [dict(r, Timestamp=datetime.datetime.fromisoformat(r['Timestamp'])) for r in self.raw_text]
+        with open(os.path.join(CLEAN_PATH_MINUTES, f'{self.name}.csv'), 'r') as cf:
+            self.expected_minute = cf.read()
+        with open(os.path.join(CLEAN_PATH_QUARTILES, f'{self.name}.csv'), 'r') as cf:
+            self.expected_quartiles = cf.read()
+
+
+def loadWeeks():
+    files = sorted(f for f in os.listdir(RAW_PATH) if f.endswith('.json'))
+    return [Week(os.path.join(RAW_PATH, f)) for f in files]
+
+
+def buildCases(weeks):
+    # name -> (function of one week, per week inputs prepared outside of the timing)
+    tr = {w.name: pricetransform.generateTransRaw(w.raw, w.start) for w in weeks}
+    minutes = {w.name: etl.transformDataToDict(w.start, tr[w.name]) for w in weeks}
+    quartiles = {w.name: etl.transformEventsToWeeklyQuartiles(w.start, tr[w.name]) for w in weeks}
+    scriptTr = {w.name: pricetransform.generateTransRaw(w.raw_text, w.start) for w in weeks}
+    scriptMinutes = {w.name: pricetransform.transformDataToDict(w.start, scriptTr[w.name]) for w in weeks}
+    return {
+        'etl.generateTransRaw': lambda w: pricetransform.generateTransRaw(w.raw, w.start),
+        'etl.transformDataToDict': lambda w: etl.transformDataToDict(w.start, tr[w.name]),
+        'etl.transformFromMinIncrementToWeeklyQuartiles': lambda w: pricetransform.transformFromMinIncrementToWeeklyQuartiles(minutes[w.name]),
+        'etl.transformEventsToWeeklyQuartiles': lambda w: etl.transformEventsToWeeklyQuartiles(w.start, tr[w.name]),
+        'etl.write_dict_as_csv.minute': lambda w: etl.write_dict_as_csv(minutes[w.name], "transformed/weekly/minute", f'{w.name}.csv', float_format=etl.PRICE_FORMAT),
+        'etl.write_dict_as_csv.quartiles': lambda w: etl.write_dict_as_csv(quartiles[w.name], "transformed/weekly/quartiles", f'{w.name}.csv'),
+        'etl.rollup_write_data': lambda w: etl.rollup_write_data(tr[w.name], w.start, w.name),
+        'etl.load_trigger_pipeline': lambda w: etl.load_trigger_pipeline(quartiles[w.name], w.name),
+        'etl.transform_write_data': lambda w: etl.transform_write_data(tr[w.name], w.start, w.name),
+        'scripts.generateTransRaw': lambda w: pricetransform.generateTransRaw(w.raw_text, w.start),
+        'scripts.transformDataToDict': lambda w: pricetransform.transformDataToDict(w.start, scriptTr[w.name]),
+        'scripts.transformFromMinIncrementToWeeklyQuartiles': lambda w: pricetransform.transformFromMinIncrementToWeeklyQuartiles(scriptMinutes[w.name]),
+        'scripts.minuteCsv': lambda w: pricetransform.dict_to_csv(scriptMinutes[w.name], pricetransform.PRICE_FORMAT),
+    }
+
+
+def runCase(fn, weeks, repeat):
+    # Seconds per week for every repeat, and the peak traced allocation of one pass
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for w in weeks:
+            fn(w)
+        times.append((time.perf_counter() - started) / len(weeks))
+    tracemalloc.start()
+    for w in weeks:
+        fn(w)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'min_ms': min(times) * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'peak_kib': peak / 1024,
+    }
+
+
+def verify(weeks, s3):
+    # Byte for byte comparison of everything the benchmarked paths write with Data/Clean
+    mismatches = []
+    for w in weeks:
+        objects = {
+            'etl minute': s3.objects.get(f'transformed/weekly/minute/{w.name}.csv', b'').decode('utf-8'),
+            'etl quartiles': s3.objects.get(f'transformed/weekly/quartiles/{w.name}.csv', b'').decode('utf-8'),
+            'etl train': s3.objects.get(f'train/{w.name}.csv', b'').decode('utf-8'),
+        }
+        minutes = pricetransform.transformDataToDict(w.start, pricetransform.generateTransRaw(w.raw_text, w.start))
+        objects['scripts minute'] = pricetransform.dict_to_csv(minutes, pricetransform.PRICE_FORMAT)
+        objects['scripts quartiles'] = pricetransform.dict_to_csv(pricetransform.transformFromMinIncrementToWeeklyQuartiles(minutes))
+        for label, body in objects.items():
+            expected = w.expected_minute if 'minute' in label else w.expected_quartiles
+            if body != expected:
+                mismatches.append(f'{w.name}: {label}')
+    return mismatches
+
+
+def gitCommit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_OF_REPO, text=True).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_OF_REPO, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+
+def printResults(results, baseline=None):
+    header = f'{"case":<50} {"min ms":>9} {"median ms":>10} {"peak KiB":>9}'
+    print(header + ('  vs baseline' if baseline else ''))
+    for name, r in results.items():
+        line = f'{name:<50} {r["min_ms"]:>9.3f} {r["median_ms"]:>10.3f} {r["peak_kib"]:>9.1f}'
+        if baseline and name in baseline:
+            line += f'  {r["min_ms"] / baseline[name]["min_ms"]:>6.2f}x'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transform hot paths on the Data fixtures")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="timed passes over all weeks per case")
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    parser.add_argument('--no-save', action='store_true', help="do not write a result file")
+    args = parser.parse_args()
+
+    weeks = loadWeeks()
+    s3 = InMemoryS3()
+    etl.S3_CLI = s3
+    results = {}
+    # The pipeline logs to stdout, keep it out of the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name, fn in buildCases(weeks).items():
+            results[name] = runCase(fn, weeks, args.repeat)
+            etl.METRICS.reset()
+    mismatches = verify(weeks, s3)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as rf:
+            baseline = json.load(rf)['results']
+    print(f'{len(weeks)} weeks, {args.repeat} repeats, times are per week')
+    printResults(results, baseline)
+
+    if not args.no_save:
+        commit = gitCommit()
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        out_path = os.path.join(RESULTS_PATH, f'{commit}.json')
+        report = {
+            'commit': commit,
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'weeks': len(weeks),
+            'repeat': args.repeat,
+            'mismatches': mismatches,
+            'results': results,
+        }
+        with open(out_path, 'w') as jf:
+            json.dump(report, jf, indent=4)
+        print(f'Results saved to {out_path}')
+
+    if mismatches:
+        print('Outputs differ from Data/Clean:')
+        for m in mismatches:
+            print(f'  {m}')
+        sys.exit(1)
+    print('All outputs match Data/Clean')
+
+
+# Entry point for script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+'''
+ * Cold start import profile of the pipeline lambdas.
+ *
+ * Every function in template.yaml is imported in a fresh interpreter with -X importtime,
+ * using its CodeUri (plus the shared layer when it has Layers) as the path, the way the
+ * Lambda runtime imports the handler module during init. The report gives the handler
+ * module's total import time and breaks it down by the modules it imports.
+ * Nothing is called, so no AWS credentials are needed.
+ *
+ * Command: python3 ImportProfile.py [--top N] [--repeat N] [--json <out file>] [function handler module ...]
+'''
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+ROOT_OF_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TEMPLATE_PATH = os.path.join(ROOT_OF_REPO, "template.yaml")
+SHARED_LAYER_PATH = os.path.join(ROOT_OF_REPO, "shared", "python")
+DEFAULT_TOP = 8
+DEFAULT_REPEAT = 3
+# Environment the modules read at import
+LAMBDA_ENV = {
+    'FORECAST_BUCKET': 'profile',
+    'AWS_DEFAULT_REGION': 'us-west-2',
+    'AWS_REGION': 'us-west-2',
+    'STEP_FUNCTIONS_ARN': 'arn:aws:states:us-west-2:000000000000:stateMachine:profile',
+    'PARAMS_FILE': 'params.json',
+    'FORECAST_ROLE': 'arn:aws:iam::000000000000:role/profile',
+}
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def getFunctions(templatePath=TEMPLATE_PATH):
+    """
+        This function will read the handler module, code directory and layer use of every function in template.yaml
+
+        Return:
+            (list of dicts) : {"module", "code_uri", "layers"} per function, in template order
+    """
+    functions = []
+    current = None
+    with open(templatePath, 'r') as tf:
+        for line in tf:
+            stripped = line.strip()
+            if re.match(r'^  \S.*:$', line.rstrip()):
+                # Next resource, two space indent under Resources
+                current = None
+            elif stripped.startswith('CodeUri:'):
+                current = {"code_uri": stripped.split(':', 1)[1].strip(), "layers": False}
+                functions.append(current)
+            elif current and stripped.startswith('Handler:'):
+                current["module"] = stripped.split(':', 1)[1].strip().rsplit('.', 1)[0]
+            elif current and stripped.startswith('Layers:'):
+                current["layers"] = True
+    return [f for f in functions if "module" in f]
+
+
+def profileImport(function):
+    # One -X importtime run, returns [(module, self us, cumulative us, depth)] in output order.
+    # A module's line follows the lines of everything it imported.
+    paths = [os.path.join(ROOT_OF_REPO, function["code_uri"])]
+    if function["layers"]:
+        paths.append(SHARED_LAYER_PATH)
+    env = dict(os.environ, **LAMBDA_ENV, PYTHONPATH=os.pathsep.join(paths))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {function["module"]}'],
+                          cwd=paths[0], env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(errors[-1] if errors else f'exit code {proc.returncode}')
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            selfUs, cumulativeUs, indent, name = match.groups()
+            modules.append((name, int(selfUs), int(cumulativeUs), len(indent) // 2))
+    return modules
+
+
+def directImports(modules, module):
+    # Total of the handler module and the cumulative time of each module it imported itself:
+    # the lines one level deeper between the handler's line and the previous line at its level
+    index = max(i for i, (name, _, _, _) in enumerate(modules) if name == module)
+    depth = modules[index][3]
+    children = {}
+    for name, _, cumulativeUs, d in reversed(modules[:index]):
+        if d <= depth:
+            break
+        if d == depth + 1:
+            children[name] = cumulativeUs
+    return modules[index][2], children
+
+
+def summarize(function, repeat, top):
+    # Median over repeat runs of the handler module total and of each module it imports directly
+    module = function["module"]
+    runs = [profileImport(function) for _ in range(repeat)]
+    parsed = [directImports(run, module) for run in runs]
+    totals = [total for total, _ in parsed]
+    breakdown = {name: statistics.median(children.get(name, 0) for _, children in parsed) for name in parsed[0][1]}
+    ranked = sorted(breakdown.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "module": module,
+        "code_uri": function["code_uri"],
+        "total_ms": statistics.median(totals) / 1000,
+        "modules_ms": {name: us / 1000 for name, us in ranked[:top]},
+        "module_count": len(runs[0]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time profile of the lambda handler modules")
+    parser.add_argument('modules', nargs='*', help="handler modules to profile, all functions in template.yaml by default")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help="imported modules listed per function")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="runs per function, the median is reported")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    functions = [f for f in getFunctions() if not args.modules or f["module"] in args.modules]
+    report = []
+    for function in functions:
+        try:
+            result = summarize(function, args.repeat, args.top)
+        except RuntimeError as e:
+            print(f'{function["module"]:<16} import failed: {e}')
+            continue
+        report.append(result)
+        print(f'{result["module"]:<16} {result["total_ms"]:>8.1f} ms  ({result["module_count"]} modules, {result["code_uri"]})')
+        for name, ms in result["modules_ms"].items():
+            print(f'    {name:<28} {ms:>8.1f} ms')
+
+    if args.json:
+        with open(args.json, 'w') as jf:
+            json.dump(report, jf, indent=4)
+        print(f'Report saved to {args.json}')
+
+
+# Entry point for script
+if __name__ == "__main__":
+    main()
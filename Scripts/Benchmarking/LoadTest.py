@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+'''
+ * Local load test of the bid suggestion server (lambdas/bidserver/bidserver.py).
+ *
+ * Writes --weeks synthetic forecast documents to a temporary directory laid out like the
+ * bucket (history/clean/ and current/) and sends synthetic requests to the server, from
+ * --clients threads, either straight to the lambda handler or over HTTP to a local server.
+ * The request mix is mostly the current document and its series, some earlier dates, a few
+ * unknown paths, and a share of the clients revalidate with the ETag of their last response
+ * (If-None-Match). Halfway through, a new week is published the way update-resources does it,
+ * the report shows the index picked it up. Nothing is called on AWS.
+ *
+ * Command: python3 LoadTest.py [--requests N] [--clients N] [--weeks N] [--http] [--seed N]
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+import threading
+import statistics
+from collections import Counter
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+ROOT_OF_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_REQUESTS = 20000
+DEFAULT_CLIENTS = 8
+DEFAULT_WEEKS = 52
+DEFAULT_SEED = 7
+# Share of the requests sent with the ETag of the client's previous response for the same path
+REVALIDATE_SHARE = 0.6
+ITEMS = ['q1', 'q2', 'q3', 'max']
+FIRST_WEEK = datetime.date(2021, 6, 21)
+
+sys.path.insert(0, os.path.join(ROOT_OF_REPO, "shared", "python"))
+sys.path.insert(0, os.path.join(ROOT_OF_REPO, "lambdas", "bidserver"))
+import bidserver
+from storage import LocalStorage
+
+
+def forecastDocument(date, rng):
+    # A document shaped like update-resources' current/<date>.json
+    base = rng.uniform(0.45, 0.6)
+    values = sorted(round(base + rng.uniform(0, 0.02), 4) for _ in ITEMS)
+    document = {"Forecast": {"Date": date.strftime('%Y-%m-%d')}}
+    document["Forecast"].update(zip(ITEMS, values))
+    return json.dumps(document, indent=4, sort_keys=True)
+
+
+def publish(storage, date, rng):
+    # Move current/ to history/clean/, then write the new week, like update-resources
+    for key in storage.list('current'):
+        storage.write('history/clean/{}'.format(key.split('/')[1]), storage.read(key))
+        storage.delete(key)
+    storage.write('current/{}.json'.format(date.strftime('%Y-%m-%d')), forecastDocument(date, rng))
+
+
+def requestPath(dates, rng):
+    # Mostly the current week, the site's main page
+    draw = rng.random()
+    if draw < 0.5:
+        return '/suggestions'
+    if draw < 0.8:
+        return f'/suggestions/current/{rng.choice(ITEMS)}'
+    if draw < 0.9:
+        return f'/suggestions/{rng.choice(dates).strftime("%Y-%m-%d")}/{rng.choice(ITEMS)}'
+    if draw < 0.95:
+        return '/suggestions/dates'
+    if draw < 0.98:
+        return f'/suggestions/{rng.choice(dates).strftime("%Y-%m-%d")}'
+    return '/suggestions/1999-01-01'
+
+
+def lambdaCaller():
+    def call(path, etag):
+        event = {'rawPath': path, 'headers': {'if-none-match': etag} if etag else {}}
+        result = bidserver.lambda_handler(event, None)
+        return result['statusCode'], result['headers'].get('ETag')
+    return call
+
+
+def httpCaller(port):
+    def call(path, etag):
+        request = Request(f'http://127.0.0.1:{port}{path}', headers={'If-None-Match': etag} if etag else {})
+        try:
+            with urlopen(request) as response:
+                response.read()
+                return response.status, response.headers.get('ETag')
+        except HTTPError as e:
+            e.read()
+            return e.code, e.headers.get('ETag')
+    return call
+
+
+def runClient(call, count, dates, seed, latencies, statuses):
+    rng = random.Random(seed)
+    etags = {}
+    for _ in range(count):
+        path = requestPath(dates, rng)
+        etag = etags.get(path) if rng.random() < REVALIDATE_SHARE else None
+        started = time.perf_counter()
+        status, response_etag = call(path, etag)
+        latencies.append(time.perf_counter() - started)
+        statuses[status] += 1
+        if status == 200:
+            etags[path] = response_etag
+
+
+def runPhase(call, requests, clients, dates, seed):
+    latencies, statuses = [], Counter()
+    threads = [
+        threading.Thread(target=runClient, args=(call, requests // clients, dates, seed + i, latencies, statuses))
+        for i in range(clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, statuses
+
+
+def printPhase(name, elapsed, latencies, statuses):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f'{name}: {len(latencies)} requests in {elapsed:.2f}s = {len(latencies) / elapsed:,.0f} req/s, '
+          f'latency p50 {statistics.median(latencies) * 1e6:.0f} us, p99 {p99 * 1e6:.0f} us, '
+          f'status {dict(sorted(statuses.items()))}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the bid suggestion server on synthetic requests")
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help="requests per phase")
+    parser.add_argument('--clients', type=int, default=DEFAULT_CLIENTS, help="concurrent client threads")
+    parser.add_argument('--weeks', type=int, default=DEFAULT_WEEKS, help="forecast documents served")
+    parser.add_argument('--http', action='store_true', help="send the requests over HTTP to a local server")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorage(root)
+        dates = [FIRST_WEEK + datetime.timedelta(weeks=i) for i in range(args.weeks)]
+        for date in dates:
+            publish(storage, date, rng)
+        # Check for a new current/ object once a second, so the refresh shows within the run
+        bidserver.INDEX = bidserver.SuggestionIndex(storage, refresh_seconds=1)
+        bidserver.INDEX.refresh()
+
+        server = None
+        if args.http:
+            from http.server import ThreadingHTTPServer
+            server = ThreadingHTTPServer(('127.0.0.1', 0), bidserver.make_handler(bidserver.INDEX))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            call = httpCaller(server.server_address[1])
+        else:
+            call = lambdaCaller()
+
+        print(f'{args.weeks} documents, {len(bidserver.INDEX.responses)} precomputed responses, '
+              f'{args.clients} clients, {"HTTP" if args.http else "in-process handler"}')
+        printPhase('before publish', *runPhase(call, args.requests, args.clients, dates, args.seed))
+
+        new_week = dates[-1] + datetime.timedelta(weeks=1)
+        publish(storage, new_week, rng)
+        time.sleep(1)
+        printPhase('after publish ', *runPhase(call, args.requests, args.clients, dates + [new_week], args.seed + 1000))
+        status, _ = call('/suggestions/current', None)
+        current = json.loads(bidserver.INDEX.lookup('/suggestions/current').body)['Forecast']['Date']
+        print(f'Index rebuilds: {bidserver.INDEX.rebuilds}, current date {current} '
+              f'({"refreshed" if current == new_week.strftime("%Y-%m-%d") else "NOT refreshed"})')
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
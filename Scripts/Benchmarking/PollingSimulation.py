@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+'''
+ * Polling simulation of the long running state machine steps.
+ *
+ * Runs the Import-Data, Create-Predictor and Create-Forecast lambdas against a simulated
+ * Forecast client on a virtual clock, for a number of weekly pipeline runs, under two
+ * polling policies:
+ *   fixed    - the former Step Functions Retry (IntervalSeconds 1, BackoffRate 1.5)
+ *   adaptive - the Wait state fed by the lambdas' WaitSeconds (shared/python/estimator.py)
+ * Resource durations are drawn from a lognormal distribution around typical Forecast
+ * durations, both policies see the same durations. The report gives the lambda invocations
+ * per run and the time lost between a resource finishing and the pipeline noticing.
+ * Nothing is called on AWS, the duration history is kept in a temporary directory.
+ *
+ * Command: python3 PollingSimulation.py [--runs N] [--seed N]
+'''
+import os
+import sys
+import random
+import argparse
+import datetime
+import tempfile
+import statistics
+
+ROOT_OF_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_RUNS = 30
+DEFAULT_SEED = 7
+# Mean seconds and lognormal sigma of every simulated resource kind
+DURATIONS = {
+    'DatasetImportJob': (420, 0.25),
+    'Predictor': (2700, 0.3),
+    'Forecast': (1500, 0.25),
+    'ForecastExportJob': (240, 0.3),
+}
+# The Retry the adaptive Wait replaces
+FIXED_INTERVAL = 1
+FIXED_BACKOFF = 1.5
+
+os.environ.update({
+    'AWS_REGION': 'us-west-2',
+    'AWS_DEFAULT_REGION': 'us-west-2',
+    'FORECAST_ROLE': 'arn:aws:iam::000000000000:role/simulation',
+    'EXPORT_ROLE': 'arn:aws:iam::000000000000:role/simulation',
+    'METRICS_MODE': 'emf',
+})
+sys.path.insert(0, os.path.join(ROOT_OF_REPO, "shared", "python"))
+for lambdaDir in ("createdatasetimportjob", "createpredictor", "createforecast"):
+    sys.path.insert(0, os.path.join(ROOT_OF_REPO, "lambdas", lambdaDir))
+import estimator
+import datasetimport
+import predictor
+import forecast
+
+
+class Clock:
+    def __init__(self):
+        self.now = datetime.datetime(2021, 8, 16, 5, 0, tzinfo=datetime.timezone.utc)
+
+    def advance(self, seconds):
+        self.now += datetime.timedelta(seconds=seconds)
+
+
+class SimulatedForecast:
+    # The describe/create calls the pipeline lambdas make, with resources that turn ACTIVE
+    # once their drawn duration has passed on the virtual clock
+    class exceptions:
+        class ResourceNotFoundException(Exception):
+            pass
+
+    def __init__(self, clock, durations):
+        self.clock = clock
+        # Durations to hand out per kind, in creation order
+        self.durations = {kind: list(seconds) for kind, seconds in durations.items()}
+        self.resources = {}
+
+    def create(self, kind, name):
+        # Resources are found by the last part of their arn, which is their name
+        self.resources[(kind, name)] = (self.clock.now, self.durations[kind].pop(0))
+
+    def describe(self, kind, arn):
+        key = (kind, arn.rsplit('/', 1)[1])
+        if key not in self.resources:
+            raise self.exceptions.ResourceNotFoundException(arn)
+        created, seconds = self.resources[key]
+        finished = created + datetime.timedelta(seconds=seconds)
+        active = self.clock.now >= finished
+        return {
+            f'{kind}Arn': arn,
+            'Status': 'ACTIVE' if active else 'CREATE_IN_PROGRESS',
+            'CreationTime': created,
+            'LastModificationTime': finished if active else self.clock.now,
+        }
+
+    def delete_all(self):
+        # The pipeline deletes the predictor and forecast at the end of every run
+        self.resources.clear()
+
+    def describe_dataset_import_job(self, DatasetImportJobArn):
+        return self.describe('DatasetImportJob', DatasetImportJobArn)
+
+    def create_dataset_import_job(self, DatasetImportJobName, **kwargs):
+        self.create('DatasetImportJob', DatasetImportJobName)
+
+    def describe_predictor(self, PredictorArn):
+        return self.describe('Predictor', PredictorArn)
+
+    def create_predictor(self, PredictorName, **kwargs):
+        self.create('Predictor', PredictorName)
+
+    def describe_forecast(self, ForecastArn):
+        return self.describe('Forecast', ForecastArn)
+
+    def create_forecast(self, ForecastName, **kwargs):
+        self.create('Forecast', ForecastName)
+
+    def get_accuracy_metrics(self, PredictorArn):
+        return {'PredictorEvaluationResults': []}
+
+    def describe_forecast_export_job(self, ForecastExportJobArn):
+        return self.describe('ForecastExportJob', ForecastExportJobArn)
+
+    def create_forecast_export_job(self, ForecastExportJobName, **kwargs):
+        self.create('ForecastExportJob', ForecastExportJobName)
+
+
+STAGES = [
+    ('Import-Data', datasetimport, ['DatasetImportJob']),
+    ('Create-Predictor', predictor, ['Predictor']),
+    ('Create-Forecast', forecast, ['Forecast', 'ForecastExportJob']),
+]
+
+
+def drawDurations(runs, seed):
+    rng = random.Random(seed)
+    return {
+        kind: [rng.lognormvariate(0, sigma) * mean for _ in range(runs)]
+        for kind, (mean, sigma) in DURATIONS.items()
+    }
+
+
+def runEvent(runDate):
+    return {
+        'bucket': 'simulation',
+        'AccountID': '000000000000',
+        'currentDate': runDate.strftime('%Y_%m_%d'),
+        'DatasetArn': 'arn:aws:forecast:us-west-2:000000000000:dataset/bidripper',
+        'DatasetGroupArn': 'arn:aws:forecast:us-west-2:000000000000:dataset-group/bidripper',
+        'params': {
+            'Datasets': [{'DatasetName': 'bidripper'}],
+            'TimestampFormat': 'yyyy-MM-dd',
+            'Predictor': {'PredictorName': 'bidripper'},
+            'Forecast': {'ForecastName': 'bidripper'},
+        },
+    }
+
+
+def runStage(module, event, clock, policy):
+    # Invoke the stage's lambda until it reports ready, returns the number of invocations
+    invocations = 0
+    while True:
+        event = module.lambda_handler(event, None)
+        invocations += 1
+        if not event['WaitSeconds']:
+            return invocations
+        if policy == 'fixed':
+            clock.advance(FIXED_INTERVAL * FIXED_BACKOFF ** (invocations - 1))
+        else:
+            clock.advance(event['WaitSeconds'])
+
+
+def simulate(policy, durations, runs):
+    """
+        This function will run every stage of runs weekly pipeline runs under one polling policy
+
+        Return:
+            (dict) : {stage: {"invocations": [per run], "lag": [per run seconds]}}
+    """
+    clock = Clock()
+    client = SimulatedForecast(clock, durations)
+    for module in (datasetimport, predictor, forecast):
+        module.LOADER._forecast_cli = client
+    estimator.now = lambda: clock.now
+    # A fresh duration history per policy
+    estimator._STORAGES.clear()
+    os.environ['STORAGE_ROOT'] = tempfile.mkdtemp(prefix=f'polling_{policy}_')
+    report = {stage: {"invocations": [], "lag": []} for stage, _, _ in STAGES}
+    for run in range(runs):
+        event = runEvent(clock.now + datetime.timedelta(weeks=run))
+        for stage, module, kinds in STAGES:
+            started = clock.now
+            # Durations this stage will be handed, the ideal stage time is their sum
+            ideal = sum(client.durations[kind][0] for kind in kinds)
+            report[stage]["invocations"].append(runStage(module, event, clock, policy))
+            report[stage]["lag"].append((clock.now - started).total_seconds() - ideal)
+        client.delete_all()
+        clock.advance(3600)
+    return report
+
+
+def printReport(reports, runs):
+    print(f'{runs} pipeline runs, invocations and detection lag (seconds) per run')
+    print(f'{"stage":<18} {"policy":<9} {"invocations":>11} {"mean lag":>9} {"p90 lag":>8} {"max lag":>8}')
+    for stage, _, _ in STAGES:
+        for policy, report in reports.items():
+            r = report[stage]
+            lags = sorted(r["lag"])
+            p90 = lags[min(len(lags) - 1, int(0.9 * len(lags)))]
+            print(f'{stage:<18} {policy:<9} {statistics.mean(r["invocations"]):>11.1f} '
+                  f'{statistics.mean(lags):>9.0f} {p90:>8.0f} {lags[-1]:>8.0f}')
+    for policy, report in reports.items():
+        invocations = sum(sum(r["invocations"]) for r in report.values()) / runs
+        lag = sum(sum(r["lag"]) for r in report.values()) / runs
+        print(f'{"total":<18} {policy:<9} {invocations:>11.1f} {lag:>9.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate fixed retry vs adaptive wait polling of the Forecast steps")
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help="weekly pipeline runs to simulate")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="seed of the drawn resource durations")
+    args = parser.parse_args()
+
+    durations = drawDurations(args.runs, args.seed)
+    reports = {policy: simulate(policy, durations, args.runs) for policy in ('fixed', 'adaptive')}
+    printReport(reports, args.runs)
+
+
+# Entry point for script
+if __name__ == "__main__":
+    main()
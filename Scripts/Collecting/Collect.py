@@ -9,43 +9,35 @@
 import sys
 import datetime
 from dateutil.relativedelta import *
-from MyImports.MyTimeFuncs import get_Number_of_Days_in_Month, is_Date_After_Yesterday, string_Month_Day_Year
-from MyImports.ThreadedCollect import ClientThread
+from MyImports.MyTimeFuncs import get_Collectable_Days_of_Month
+from MyImports.ThreadedCollect import collect_Days
 import re
 
 # Make sure that an argujkment is correctly passed in from command line
 if len(sys.argv) < 2:
     print("Not enough arguments")
-    print("Command: python3 Collect.py <integer value of month>-<integer value for year>\n\tMonth range: 1-12\n\tYear Range: 2000-*")
+    print("Command: python3 Collect.py <integer value of month>-<integer value for year> [<month>-<year> ...]\n\tMonth range: 1-12\n\tYear Range: 2000-*")
     sys.exit("Argument not in correct format")
 
-# Assign argument to variable
-cla = sys.argv[1]
-
 # Compile a egex that matches the form <month>-<year> with month and year as integer values
 p = re.compile(r'^(0[1-9]|1[0-2])-(2[0-9]{3})$')
 
-# Check to make sure command line arg matches the correct form
-if not bool(p.match(cla)):
-    print("Command: python3 Collect.py <integer value of month>-<integer value for year>\n\tMonth range: 1-12\n\tYear Range: 2000-*")
-    sys.exit("Argument not in correct format")
+days = []
+for cla in sys.argv[1:]:
+    # Check to make sure command line arg matches the correct form
+    if not bool(p.match(cla)):
+        print("Command: python3 Collect.py <integer value of month>-<integer value for year> [<month>-<year> ...]\n\tMonth range: 1-12\n\tYear Range: 2000-*")
+        sys.exit("Argument not in correct format")
+
+    # This returns a dateteime object representing the first day and moment of the month and year passed in as argument
+    month = datetime.datetime.strptime(cla, "%m-%Y")
+
+    # Every day of the month up to yesterday
+    days.extend(get_Collectable_Days_of_Month(month))
+
+# Collect all days of all months on one bounded pool of workers, waits for every day to finish
+results = collect_Days(days)
 
-# This returns a dateteime object representing the first day and moment of the month and year passed in as argument
-month = datetime.datetime.strptime(cla, "%m-%Y")
-
-# Check if current month, and do not collect data 
-today = datetime.datetime.now()
-
-# Pass each day of the month to a thread until the last month is passed.
-numberOfDays = get_Number_of_Days_in_Month(month)
-
-for i in range(numberOfDays):
-    tData = month + datetime.timedelta(days=i)
-    # Check if new date comes after yesterday (collect whole day data only)
-    if is_Date_After_Yesterday(tData):
-        print(f"{tData}: Cannot retrieve full day data")
-        break
-    # Pass date to thread
-    ct = ClientThread(tData)
-    # Start thread
-    ct.start() 
\ No newline at end of file
+# Non zero exit status if any day failed, so it can be retried
+if any(r.status == 'failed' for r in results):
+    sys.exit("Some days failed, rerun to retry them")
@@ -6,8 +6,9 @@
  * (c) Copyright - If you use my code please credit me.
 '''
 import datetime
-from subprocess import Popen
 from dateutil.relativedelta import relativedelta
+from MyImports.MyTimeFuncs import get_Collectable_Days_of_Month
+from MyImports.ThreadedCollect import collect_Days
 
 # AWS only provides 3 months of spot price history so we go
 # back 3 months and make a list of strings to pass as args to Collect.py
@@ -20,13 +21,14 @@ for i in range(4):
     tMonth = three_months_ago + relativedelta(months=i)
     months_of_interest.append(tMonth.strftime("%m-%Y"))
 
-# Main will create a subprocess and call Collect.py and pass the args
+# Main will collect every day of every month of interest on one pool of workers
 def main():
 
     # Retrive data up to yesterday
+    days = []
     for month in months_of_interest:
-        p = Popen(["python3", "./Collect.py", month])
-        p.wait()
+        days.extend(get_Collectable_Days_of_Month(datetime.datetime.strptime(month, "%m-%Y")))
+    collect_Days(days)
 # Entry point for script
 if __name__ == "__main__":
     main()
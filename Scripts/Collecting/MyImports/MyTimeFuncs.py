@@ -125,3 +125,24 @@ def first_And_Last_of_Month(month):
     """
     first, last = get_First_Moment_Of_Month(month), get_Last_Moment_Of_Month(month)
     return first, last
+
+def get_Collectable_Days_of_Month(month):
+    """
+        This function will return every day of a month for which a full day of data can be collected,
+        that is every day of the month up to and including yesterday
+
+        Parameters:
+            month (datetime object) : First moment of the month
+        
+        Return:
+            days (list of datetime objects) : First moment of each collectable day
+    """
+    days = []
+    for i in range(get_Number_of_Days_in_Month(month)):
+        day = month + datetime.timedelta(days=i)
+        # Check if new date comes after yesterday (collect whole day data only)
+        if is_Date_After_Yesterday(day):
+            print(f"{day}: Cannot retrieve full day data")
+            break
+        days.append(day)
+    return days
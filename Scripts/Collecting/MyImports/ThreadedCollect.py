@@ -5,106 +5,196 @@
  * 
  * (c) Copyright - If you use my code please credit me.
 '''
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import threading
-import boto3
+import time
+from botocore.exceptions import ClientError
 from MyImports.MyTimeFuncs import get_First_Moment_of_Day, get_Last_Moment_of_Day, string_Year_Month, string_Year_Month_Day
 import os
-import json
 import sys
 
 # Path to directory for raw data
 
 ROOT_OF_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 RAW_PATH = os.path.join(ROOT_OF_REPO, "Data", "Raw", "Daily")
+# The raw file format is shared with the ETL lambda (shared/python)
+sys.path.insert(0, os.path.join(ROOT_OF_REPO, "shared", "python"))
+from rawevents import RAW_EXTENSION, LEGACY_EXTENSION, encode_record, open_raw_writer
+from clients import get_client
 
-class ClientThread(threading.Thread):
-	def __init__(self, date):
+MAX_WORKERS = 8
+# Requests per second the limiter starts at and never exceeds, and the floor it backs off to
+MAX_RATE = 10.0
+MIN_RATE = 0.5
+MAX_ATTEMPTS = 8
+THROTTLE_CODES = {'RequestLimitExceeded', 'Throttling', 'ThrottlingException'}
+
+INSTANCE_TYPES = ['c4.8xlarge']
+MAX_RESULTS = 1000
+FILTERS = [
+	{
+		'Name' : 'availability-zone',
+		'Values' : [
+			'us-west-2a'
+		]
+	},
+	{
+		'Name' : 'product-description',
+		'Values' : [
+			'Linux/UNIX'
+		]
+	}
+]
+
+class RateLimiter:
+	def __init__(self, rate=MAX_RATE, max_rate=MAX_RATE, min_rate=MIN_RATE):
+		'''
+			Token bucket shared by all workers. The refill rate adapts to the API: it is halved
+			whenever a request is throttled and creeps back up with every successful request.
+		'''
+		self.lock = threading.Lock()
+		self.rate = rate
+		self.max_rate = max_rate
+		self.min_rate = min_rate
+		self.tokens = 1.0
+		self.last = time.monotonic()
+
+	def acquire(self):
+		# Block until a token is available, the bucket holds one second of requests (at least one)
+		while True:
+			with self.lock:
+				now = time.monotonic()
+				self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.last) * self.rate)
+				self.last = now
+				if self.tokens >= 1.0:
+					self.tokens -= 1.0
+					return
+				wait = (1.0 - self.tokens) / self.rate
+			time.sleep(wait)
+
+	def throttled(self):
+		# Multiplicative decrease, and drop any burst saved up at the old rate
+		with self.lock:
+			self.rate = max(self.min_rate, self.rate / 2)
+			self.tokens = 0.0
+
+	def succeeded(self):
+		# Additive increase back towards the maximum rate
+		with self.lock:
+			self.rate = min(self.max_rate, self.rate + 0.5)
+
+class DayResult:
+	def __init__(self, date, status, records=0, attempts=0, detail=''):
+		'''
+			Outcome of collecting one day: status is one of success, skip, empty or failed
 		'''
-            Constructor
-        '''
-		threading.Thread.__init__(self)
-		
-		self.client = boto3.client('s3')
-		self.start_time = get_First_Moment_of_Day(date)
-		self.stop_time = get_Last_Moment_of_Day(date)
-		self.out_file_parent_dir = os.path.join(RAW_PATH, string_Year_Month(date))
-		self.out_file_name = f'{string_Year_Month_Day(date)}.json'
-		self.out_file_path = os.path.join(self.out_file_parent_dir, self.out_file_name)
-		self.client = boto3.client('ec2')
-		self.instance_types = ['c4.8xlarge']
-		self.max_results=1000
-		self.filters = [
-						{
-							'Name' : 'availability-zone',
-							'Values' : [
-								'us-west-2a'
-							]
-						},
-						{
-							'Name' : 'product-description',
-							'Values' : [
-								'Linux/UNIX'
-							]
-						}
-					]
-
-		os.makedirs (self.out_file_parent_dir, exist_ok=True)
-
-
-    # This is the entry point for the thread. At this point in the code
-    # the constructor has executed
-	def run(self):
-		# If the out put file already exists RETURN - DO NOT MNOVE FORWARD
-		if os.path.exists(self.out_file_path):
-			print(f'{self.out_file_path} exists, terminating thread')
-			sys.exit("Data already exists")
-		data_out = self.retrieve_data(self.start_time, self.stop_time)
-		if data_out:	
-			self.write_to_file(data_out)
-		else:
-			print(f'Outside 90 day window, no history for {self.start_time:%D}')
-	def retrieve_data(self, startTime, stopTime):
+		self.date = date
+		self.status = status
+		self.records = records
+		self.attempts = attempts
+		self.detail = detail
+
+def create_Client(workers=MAX_WORKERS):
+	# One EC2 client shared by every worker (boto3 clients are thread safe). Retries are left
+	# to the rate limiter so a throttled request slows every worker down, not just one.
+	return get_client('ec2', max_pool_connections=workers, retries={'max_attempts': 1, 'mode': 'standard'})
+
+def out_File_Path(date, extension=RAW_EXTENSION):
+	return os.path.join(RAW_PATH, string_Year_Month(date), f'{string_Year_Month_Day(date)}.{extension}')
+
+def call_With_Backoff(client, limiter, **kwargs):
+	# One describe_spot_price_history call, retried with exponential backoff while throttled.
+	# Returns the response and the number of attempts it took.
+	for attempt in range(1, MAX_ATTEMPTS + 1):
+		limiter.acquire()
 		try:
-			data_out = []
-			nOfCalls = 0
-			response = self.client.describe_spot_price_history(
-				Filters=self.filters, 
-				DryRun=False,
-				EndTime=stopTime,
-				InstanceTypes=self.instance_types,
-				MaxResults=self.max_results,
-				StartTime=startTime
-			)
-			nOfCalls+=1
-			data = response.get('SpotPriceHistory')
-			data_out = data
-			del data
-			pagination_token = response.get('NextToken')
-			while(pagination_token):
-				response = self.client.describe_spot_price_history(
-					Filters=self.filters,
-					DryRun=False,
-					EndTime=stopTime,
-					InstanceTypes=self.instance_types,
-					MaxResults=self.max_results,
-					StartTime=startTime,
-					NextToken=pagination_token
-				)
-				nOfCalls += 1
-				data = response.get('SpotPriceHistory')
-				data_out = data_out + data
-				del data
-
-			return data_out 
-		except Exception as e:
-			# If there is any exception, print to stdout so that data is retrieved later
-			print(f'EXCEPTION:{e}:{self.start_time:%D}')		
-
-	def defaultconverter(self, o):
-		if isinstance(o, datetime):
-			return o.__str__()
-
-	def write_to_file(self, data_out):
-		with open(self.out_file_path, 'w') as jf:
-			json.dump(data_out, jf, indent=4, sort_keys=True, default=self.defaultconverter)
+			response = client.describe_spot_price_history(**kwargs)
+		except ClientError as e:
+			if e.response.get('Error', {}).get('Code') not in THROTTLE_CODES or attempt == MAX_ATTEMPTS:
+				raise
+			limiter.throttled()
+			time.sleep(min(30, 0.5 * 2 ** attempt))
+			continue
+		limiter.succeeded()
+		return response, attempt
+
+def retrieve_data(client, limiter, startTime, stopTime, result):
+	# Generator over the records of every page, pages are fetched as the records are consumed
+	# and dropped afterwards. API calls made are counted on result.
+	kwargs = dict(
+		Filters=FILTERS,
+		DryRun=False,
+		EndTime=stopTime,
+		InstanceTypes=INSTANCE_TYPES,
+		MaxResults=MAX_RESULTS,
+		StartTime=startTime
+	)
+	while True:
+		response, tries = call_With_Backoff(client, limiter, **kwargs)
+		result.attempts += tries
+		yield from response.get('SpotPriceHistory', [])
+		pagination_token = response.get('NextToken')
+		if not pagination_token:
+			return
+		kwargs['NextToken'] = pagination_token
+
+def write_to_file(out_file_path, records):
+	# Stream records into the file as gzip compressed NDJSON, one compact record per line.
+	# The file is built under a temporary name and only moved into place when it holds
+	# records, so a failed or empty day never leaves a file behind. Returns the record count.
+	os.makedirs(os.path.dirname(out_file_path), exist_ok=True)
+	part_path = f'{out_file_path}.part'
+	count = 0
+	try:
+		with open(part_path, 'wb') as f, open_raw_writer(f) as gz:
+			for record in records:
+				gz.write(encode_record(record))
+				count += 1
+		if count:
+			os.replace(part_path, out_file_path)
+	finally:
+		if os.path.exists(part_path):
+			os.remove(part_path)
+	return count
+
+def collect_Day(client, limiter, date):
+	# Collect and write one full day of spot price history, never raises
+	out_file_path = out_File_Path(date)
+	# If the out put file already exists, in either format, DO NOT MOVE FORWARD
+	for existing in (out_file_path, out_File_Path(date, LEGACY_EXTENSION)):
+		if os.path.exists(existing):
+			return DayResult(date, 'skip', detail=f'{existing} exists')
+	result = DayResult(date, 'success')
+	try:
+		result.records = write_to_file(out_file_path, retrieve_data(client, limiter, get_First_Moment_of_Day(date), get_Last_Moment_of_Day(date), result))
+	except Exception as e:
+		# If there is any exception, report it in the summary so that data is retrieved later
+		result.status = 'failed'
+		result.detail = f'EXCEPTION:{e}'
+		return result
+	if not result.records:
+		result.status = 'empty'
+		result.detail = 'Outside 90 day window, no history'
+	return result
+
+def collect_Days(dates, workers=MAX_WORKERS):
+	"""
+		This function will collect every day in dates on a fixed size pool of worker threads that share
+		one EC2 client and one rate limiter, wait for all of them, and print a per-day summary.
+
+		Parameters:
+			dates (list of datetime objects) : Days to collect
+			workers (int) : Number of worker threads
+
+		Return:
+			results (list of DayResult) : One result per day, in the order of dates
+	"""
+	client = create_Client(workers)
+	limiter = RateLimiter()
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		results = list(pool.map(lambda date: collect_Day(client, limiter, date), dates))
+	for r in results:
+		print(f'{r.date:%Y-%m-%d}  {r.status:<8} records={r.records:<6} calls={r.attempts:<3} {r.detail}')
+	counts = {status: sum(r.status == status for r in results) for status in ('success', 'skip', 'empty', 'failed')}
+	print(', '.join(f'{status}: {count}' for status, count in counts.items()) + f' (final rate {limiter.rate:.1f} req/s)')
+	return results
@@ -6,30 +6,82 @@
  * (c) Copyright - If you use my code please credit me.
 '''
 import os
-from subprocess import Popen
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from MyImports.MyTransFuncs import getDateTimeFromInFilePath, generateOutFilePath, writeCsv
+from pricetransform import (FILE_NAME_TIME_FORMAT, PRICE_FORMAT, C4, DAYS_IN_WEEK, generateTransRaw,
+                            transformDataToDict, transformMinuteMatrixToWeeklyQuartiles)
+from MyImports.MinuteArchive import MinuteArchive
+from MyImports.RawEvents import isRawFile, iterRawEvents
 
 ROOT_OF_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 RAW_PATH = os.path.join(ROOT_OF_REPO, "Data", "Raw", "Weekly")
+CLEAN_PATH_MINUTES = os.path.join(ROOT_OF_REPO, "Data", "Clean", "Minute")
+CLEAN_PATH_DAILY_QUARTILES = os.path.join(ROOT_OF_REPO, "Data", "Clean", "Quartiles")
+# Batches smaller than this are transformed in this process, pool startup would cost more than it saves
+PARALLEL_MIN_WEEKS = 8
 
 def getListOfAllRawFilesRecursively(topLevelDir=RAW_PATH):
     rawFilesList = []
-    # Retrieve all json data files under the <ROOT>/Data/Raw directory (Recurse)
+    # Retrieve all raw data files (.ndjson.gz or .json) under the <ROOT>/Data/Raw directory (Recurse)
     for current_dir, _, files in os.walk(topLevelDir):
         # Skip subdirs since we're only interested in files.
         for filename in files:
-            if filename.endswith( '.json' ):
+            if isRawFile( filename ):
                 relative_path = os.path.join( current_dir, filename )
                 absolute_path = os.path.abspath( relative_path )
                 rawFilesList.append(absolute_path)
     return rawFilesList
 
+def getOutFilePaths(rawFile, startDate):
+    # Minute and quartile csv paths for a raw weekly file, same layout as Transform.py
+    outFileName = f'{startDate.strftime(FILE_NAME_TIME_FORMAT)}.csv'
+    outFilePathMin = generateOutFilePath(CLEAN_PATH_MINUTES, rawFile, outFileName)
+    outFilePathQuart = generateOutFilePath(CLEAN_PATH_DAILY_QUARTILES, rawFile, outFileName)
+    return outFilePathMin, outFilePathQuart
+
+def isPending(rawFile, archive):
+    # A week is pending unless both csv files exist and the archive holds the whole week
+    startDate = getDateTimeFromInFilePath(rawFile)
+    outFilePathMin, outFilePathQuart = getOutFilePaths(rawFile, startDate)
+    weekEnd = startDate + datetime.timedelta(days=DAYS_IN_WEEK)
+    return not (os.path.isfile(outFilePathMin) and os.path.isfile(outFilePathQuart)
+                and archive.contains(C4, startDate, weekEnd))
+
+def resampleAndWriteMinutes(rawFile):
+    # Per week work that parallelizes cleanly: parse, resample and write the minute csv.
+    # Returns the week's minute prices for the batch quartile computation.
+    startDate = getDateTimeFromInFilePath(rawFile)
+    outFilePathMin, _ = getOutFilePaths(rawFile, startDate)
+    # Records are streamed from the file, only their timestamps and prices are kept
+    time_series_dict = transformDataToDict(startDate, generateTransRaw(iterRawEvents(rawFile), startDate))
+    writeCsv(outFilePathMin, time_series_dict, PRICE_FORMAT)
+    return time_series_dict["SpotPrice"]
+
 def main():
-    filesList = getListOfAllRawFilesRecursively()
-    # Execute Transform script on all files in files list
-    for rawFile in filesList:
-        p = Popen(["python3", "./Transform.py", rawFile])  
-        p.wait()
- 
+    archive = MinuteArchive()
+    pending = sorted(f for f in getListOfAllRawFilesRecursively() if isPending(f, archive))
+    if not pending:
+        # Up to date is the normal outcome of a rerun, not a failure
+        print("Nothing to transform")
+        return
+    print(f'Transforming {len(pending)} weeks')
+    # Every pending week is handled in this one process, or spread over a process pool for large batches
+    if len(pending) >= PARALLEL_MIN_WEEKS:
+        with ProcessPoolExecutor() as pool:
+            weeks = list(pool.map(resampleAndWriteMinutes, pending))
+    else:
+        weeks = [resampleAndWriteMinutes(rawFile) for rawFile in pending]
+    # Stack the weeks into a weeks x minutes matrix, quartiles of all weeks in one call
+    priceMatrix = np.vstack(weeks)
+    startDates = [getDateTimeFromInFilePath(rawFile) for rawFile in pending]
+    quartDicts = transformMinuteMatrixToWeeklyQuartiles(startDates, priceMatrix)
+    for rawFile, startDate, prices, quartDict in zip(pending, startDates, priceMatrix, quartDicts):
+        _, outFilePathQuart = getOutFilePaths(rawFile, startDate)
+        writeCsv(outFilePathQuart, quartDict)
+        archive.write(C4, startDate, prices)
+
 # Entry point for script
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
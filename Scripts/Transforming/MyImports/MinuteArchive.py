@@ -0,0 +1,156 @@
+'''
+ * Compact archive of per-minute spot prices.
+ *
+ * Every series is one flat file of little-endian float32 prices, one per minute,
+ * with no timestamps or labels stored per row. index.json maps a series to its file
+ * and the epoch minute of the file's first price, so the minute of any element is
+ * implied by its offset. Files are read with np.memmap and never parsed.
+'''
+import os
+import json
+import numpy as np
+
+ROOT_OF_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+ARCHIVE_PATH = os.path.join(ROOT_OF_REPO, "Data", "Clean", "Minute", "Archive")
+INDEX_FILE_NAME = "index.json"
+PRICE_DTYPE = np.dtype('<f4')
+
+
+def epoch_Minute(date):
+    """
+        This function will return the number of minutes between the unix epoch and date
+
+        Parameters:
+            date (datetime object or datetime64) : Date to convert
+
+        Return:
+            (int) : Minutes since 1970-01-01 00:00
+    """
+    return int(np.datetime64(date, 'm').astype(np.int64))
+
+
+class MinuteArchive:
+    def __init__(self, root=ARCHIVE_PATH):
+        '''
+            Constructor
+        '''
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILE_NAME)
+        os.makedirs(root, exist_ok=True)
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'r') as jf:
+                self.index = json.load(jf)
+        else:
+            self.index = {}
+
+    def _save_index(self):
+        with open(self.index_path, 'w') as jf:
+            json.dump(self.index, jf, indent=4, sort_keys=True)
+
+    def _path(self, series):
+        return os.path.join(self.root, self.index[series]["file"])
+
+    def _memmap(self, series, mode='r'):
+        return np.memmap(self._path(series), dtype=PRICE_DTYPE, mode=mode, shape=(self.index[series]["length"],))
+
+    def series(self):
+        """
+            This function will return the names of all series in the archive
+
+            Return:
+                (list of strings) : Series names
+        """
+        return sorted(self.index)
+
+    def span(self, series):
+        """
+            This function will return the first minute and the minute after the last price of a series
+
+            Parameters:
+                series (string) : Series name, e.g. the instance type
+
+            Return:
+                first, end (datetime64[m]) : Half open range of minutes held for series
+        """
+        entry = self.index[series]
+        first = np.datetime64(entry["start"], 'm')
+        return first, first + entry["length"]
+
+    def contains(self, series, start, end):
+        """
+            This function will check if every minute of [start, end) has a price archived for series
+
+            Parameters:
+                series (string) : Series name, e.g. the instance type
+                start (datetime object or datetime64) : First minute of interest
+                end (datetime object or datetime64) : Minute after the last minute of interest
+
+            Return:
+                (bool) : True if the whole range is archived
+        """
+        if series not in self.index:
+            return False
+        first, last = self.span(series)
+        if np.datetime64(start, 'm') < first or np.datetime64(end, 'm') > last:
+            return False
+        return not np.isnan(self.query(series, start, end)).any()
+
+    def write(self, series, start, prices):
+        """
+            This function will store consecutive per-minute prices of a series, beginning at start.
+            Minutes already in the archive are overwritten, so writing a week twice is harmless.
+            Minutes between the end of the file and start are filled with NaN.
+
+            Parameters:
+                series (string) : Series name, e.g. the instance type
+                start (datetime object or datetime64) : Minute of the first price
+                prices (array like of floats) : One price per minute
+        """
+        prices = np.asarray(prices, dtype=PRICE_DTYPE)
+        start_minute = epoch_Minute(start)
+        entry = self.index.get(series)
+        if entry is None:
+            file_name = f'{series.replace("/", "_")}.f32'
+            entry = {"file": file_name, "start": start_minute, "length": 0}
+            self.index[series] = entry
+            open(self._path(series), 'wb').close()
+        if start_minute < entry["start"]:
+            # Prepending shifts every offset, so the file is rewritten once with the new origin
+            old = np.fromfile(self._path(series), dtype=PRICE_DTYPE)
+            shifted = np.full(entry["start"] - start_minute + old.size, np.nan, dtype=PRICE_DTYPE)
+            shifted[entry["start"] - start_minute:] = old
+            shifted.tofile(self._path(series))
+            entry["length"] = shifted.size
+            entry["start"] = start_minute
+        offset = start_minute - entry["start"]
+        end = offset + prices.size
+        if end > entry["length"]:
+            # Grow the file, filling any gap before this write with NaN
+            with open(self._path(series), 'ab') as af:
+                np.full(end - entry["length"], np.nan, dtype=PRICE_DTYPE).tofile(af)
+            entry["length"] = end
+        mm = self._memmap(series, 'r+')
+        mm[offset:end] = prices
+        mm.flush()
+        del mm
+        self._save_index()
+
+    def query(self, series, start, end):
+        """
+            This function will return the per-minute prices of a series for [start, end) as a read only
+            view into the memory mapped file, nothing is copied or parsed.
+
+            Parameters:
+                series (string) : Series name, e.g. the instance type
+                start (datetime object or datetime64) : First minute of interest
+                end (datetime object or datetime64) : Minute after the last minute of interest
+
+            Return:
+                (np.memmap of float32) : One price per minute, NaN for minutes never written
+        """
+        entry = self.index[series]
+        first = epoch_Minute(start) - entry["start"]
+        last = epoch_Minute(end) - entry["start"]
+        if first < 0 or last > entry["length"] or first > last:
+            raise ValueError(f'{start} - {end} is outside the archived range of {series}')
+        return self._memmap(series)[first:last]
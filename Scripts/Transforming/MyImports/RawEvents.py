@@ -0,0 +1,32 @@
+'''
+ * Streaming reader for raw spot price files.
+ *
+ * Raw files are gzip compressed NDJSON (<date>.ndjson.gz), one compact json object per
+ * line with only the fields the transform reads. Files are read line by line, so memory
+ * use does not depend on the size of the file. Files written before the format change
+ * are plain json arrays (<date>.json) and are still accepted.
+ * The format itself lives in the shared transform core (shared/python/rawevents.py).
+'''
+import os
+from MyImports.MyTransFuncs import LocalStorage
+from rawevents import RAW_EXTENSION, LEGACY_EXTENSION, read_raw_events
+
+
+def isRawFile(fileName):
+    return fileName.endswith(f'.{RAW_EXTENSION}') or fileName.endswith(f'.{LEGACY_EXTENSION}')
+
+
+def iterRawEvents(filePath, series=None):
+    """
+        This function will stream the records of a raw file, optionally only those of some series
+
+        Parameters:
+            filePath (string) : Path to a .ndjson.gz or legacy .json raw file
+            series (iterable of tuples) : (InstanceType, AvailabilityZone, ProductDescription) of
+                                          the series wanted, None for every record
+
+        Return:
+            (generator of dicts) : Raw records in file order
+    """
+    directory, fileName = os.path.split(os.path.abspath(filePath))
+    return read_raw_events(LocalStorage(directory), fileName, series)
@@ -6,9 +6,14 @@
  * 
  * (c) Copyright - If you use my code please credit me.
 '''
-import json
-import pandas as pd
-from MyImports.MyTransFuncs import *
+import os
+import sys
+import datetime
+from MyImports.MyTransFuncs import checkAndSetInFile, getDateTimeFromInFilePath, generateOutFilePath, writeCsv
+from pricetransform import (FILE_NAME_TIME_FORMAT, PRICE_FORMAT, C4, DAYS_IN_WEEK, generateTransRaw,
+                            transformDataToDict, transformFromMinIncrementToWeeklyQuartiles)
+from MyImports.MinuteArchive import MinuteArchive
+from MyImports.RawEvents import iterRawEvents
 
 # Paths to root of repo and transform data directory
 ROOT_OF_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -25,39 +30,33 @@ outFileName = f'{starting_datetime.strftime(FILE_NAME_TIME_FORMAT)}.csv'
 outFilePathMin = generateOutFilePath(CLEAN_PATH_MINUTES, inFilePath, outFileName)
 outFilePathQuart = generateOutFilePath(CLEAN_PATH_DAILY_QUARTILES, inFilePath, outFileName)
 
+# Memory mapped per-minute archive, shared by every week of every series
+archive = MinuteArchive()
+weekEnd = starting_datetime + datetime.timedelta(days=DAYS_IN_WEEK)
+weekArchived = archive.contains(C4, starting_datetime, weekEnd)
+
 # If file exists exit
-if os.path.isfile(outFilePathMin) and os.path.isfile(outFilePathQuart):
-    wMss = f'Skipping: {outFilePathMin} and {outFilePathQuart} exist'
+if os.path.isfile(outFilePathMin) and os.path.isfile(outFilePathQuart) and weekArchived:
+    wMss = f'Skipping: {outFilePathMin}, {outFilePathQuart} and archive exist'
     sys.exit(wMss)
 
 
-# Read into raw from data file
-with open(inFilePath, 'r') as jf:
-    raw = json.load(jf)
+# Stream raw records from data file (.ndjson.gz, or legacy .json)
+raw = iterRawEvents(inFilePath)
 
 # Transform raw data to transition_raw dictionary, clean time stamps.
 transition_raw = generateTransRaw(raw, starting_datetime)
 
 time_series_dict = transformDataToDict(starting_datetime, transition_raw)
 
-# Now time series dict is in a form to create a pandas data frame
-df = pd.DataFrame(time_series_dict)
-
-# Set the Timestamp column as the dataframe index
-df.set_index(TS, inplace=True)
-
+# Write time series dict to csv file without header, prices at the raw data's 6 decimal precision
+writeCsv(outFilePathMin, time_series_dict, PRICE_FORMAT)
 
-# Write data frame to csv file without header
-df.to_csv(outFilePathMin, header=False)
+# Write the week's prices to the archive as well
+archive.write(C4, starting_datetime, time_series_dict["SpotPrice"])
 
 # Transform again but into daily value quartiles
 quartile_dict = transformFromMinIncrementToWeeklyQuartiles(time_series_dict)
 
-# Now daily quartiles dict is in df form for csv writing
-df = pd.DataFrame(quartile_dict)
-
-# Set the Timestamp column as the dataframe index
-df.set_index(TS, inplace=True)
-
-# Write data frame to csv file without header
-df.to_csv(outFilePathQuart, header=False)
+# Write quartile dict to csv file without header
+writeCsv(outFilePathQuart, quartile_dict)
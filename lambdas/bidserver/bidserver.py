@@ -0,0 +1,225 @@
+import json
+import time
+import hashlib
+import threading
+from os import environ
+from storage import LocalStorage, S3Storage
+
+# Serves the weekly bid suggestions update-resources (or LocalForecast) writes to
+# current/<date>.json, and the earlier ones moved to history/clean/, from an in-memory index.
+# Every response body and its ETag is built once, when the index is loaded, so a request is
+# a dict lookup. The index lists current/ at most every REFRESH_SECONDS and is only rebuilt
+# when a new current/ object appeared. Routes (GET):
+#   /suggestions, /suggestions/current      the current forecast document
+#   /suggestions/dates                      the current date and every date served
+#   /suggestions/<YYYY-MM-DD>               the forecast document of that date
+#   /suggestions/<current|YYYY-MM-DD>/<id>  one series (item_id q1, q2, q3 or max)
+# ?quantile= selects the forecast type, documents hold the p50 (params.json ForecastTypes).
+CURRENT_PREFIX = 'current/'
+HISTORY_PREFIX = 'history/clean/'
+ROUTE_PREFIX = 'suggestions'
+REFRESH_SECONDS = float(environ.get('REFRESH_SECONDS', 60))
+DEFAULT_QUANTILE = 'p50'
+CACHE_CONTROL = 'public, max-age={:.0f}'.format(REFRESH_SECONDS)
+
+
+class Response:
+    # A precomputed response: body bytes, its ETag and the lambda (API Gateway) results for
+    # a full and a not modified answer
+    def __init__(self, document, status=200):
+        self.status = status
+        self.body = json.dumps(document, sort_keys=True).encode('utf-8')
+        self.etag = '"{}"'.format(hashlib.sha1(self.body).hexdigest()[:20])
+        self.headers = {'Content-Type': 'application/json', 'ETag': self.etag, 'Cache-Control': CACHE_CONTROL}
+        self.result = {'statusCode': status, 'headers': self.headers, 'body': self.body.decode('utf-8')}
+        self.not_modified = {'statusCode': 304, 'headers': self.headers, 'body': ''}
+
+    def matches(self, if_none_match):
+        # True when If-None-Match names this response's ETag (weak or strong) or is *
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return any(tag == '*' or tag.replace('W/', '', 1) == self.etag for tag in tags)
+
+
+def error(status, message):
+    # Errors are built per request and never revalidated
+    response = Response({'Error': message}, status)
+    response.headers['Cache-Control'] = 'no-store'
+    del response.headers['ETag']
+    return response
+
+
+class SuggestionIndex:
+    def __init__(self, storage, refresh_seconds=REFRESH_SECONDS, clock=time.monotonic):
+        self.storage = storage
+        self.refresh_seconds = refresh_seconds
+        self.clock = clock
+        self.current_key = None
+        self.checked = None
+        self.rebuilds = 0
+        # Parsed documents by key, a key's object is never rewritten so it is only read once
+        self.documents = {}
+        # {(date or 'current' or 'dates', item_id or None, quantile): Response}
+        self.responses = {}
+        self.lock = threading.Lock()
+
+    def refresh(self, force=False):
+        # Returns True when the index was rebuilt. Requests keep being answered from the
+        # previous responses while one thread rebuilds, the others do not wait for it. Until
+        # the first responses are built (a cold container) there is nothing to answer from,
+        # so those requests wait for the first load instead.
+        now = self.clock()
+        wait = force or not self.responses
+        if not wait and self.is_fresh(now):
+            return False
+        if not self.lock.acquire(blocking=wait):
+            return False
+        try:
+            # A request that waited finds the load it waited for done and does not repeat it
+            if not force and self.is_fresh(self.clock()):
+                return False
+            return self.rebuild(now, force)
+        finally:
+            self.lock.release()
+
+    def is_fresh(self, now):
+        return self.checked is not None and now - self.checked < self.refresh_seconds
+
+    def rebuild(self, now, force):
+        self.checked = now
+        current = self.storage.list(CURRENT_PREFIX)
+        # update-resources moves the old forecast out before it writes the new one,
+        # the index keeps serving the old one until the new one is there
+        if not current or (current[-1] == self.current_key and not force):
+            return False
+        keys = self.storage.list(HISTORY_PREFIX) + current
+        self.documents = {key: self.documents.get(key) or self.read(key) for key in keys}
+        self.responses = self.build(current[-1])
+        self.current_key = current[-1]
+        self.rebuilds += 1
+        print(f'Index rebuilt from {len(keys)} documents, current {self.current_key}')
+        return True
+
+    def read(self, key):
+        return json.loads(self.storage.read(key))['Forecast']
+
+    def build(self, current_key):
+        # One response per document, per series of every document and for the date list.
+        # A date in current/ replaces the same date in history/clean/.
+        by_date = {}
+        for key, document in self.documents.items():
+            if key.startswith(HISTORY_PREFIX):
+                by_date[document['Date']] = document
+        for key, document in self.documents.items():
+            if key.startswith(CURRENT_PREFIX):
+                by_date[document['Date']] = document
+        current_date = self.documents[current_key]['Date']
+        responses = {}
+        for date, document in by_date.items():
+            aliases = [date, 'current'] if date == current_date else [date]
+            full = Response({'Forecast': document})
+            series = {
+                item: Response({'Date': date, 'Series': item, 'Quantile': DEFAULT_QUANTILE, 'Value': value})
+                for item, value in document.items() if item != 'Date'
+            }
+            for alias in aliases:
+                responses[(alias, None, DEFAULT_QUANTILE)] = full
+                for item, response in series.items():
+                    responses[(alias, item, DEFAULT_QUANTILE)] = response
+        responses[('dates', None, DEFAULT_QUANTILE)] = Response({'Current': current_date, 'Dates': sorted(by_date)})
+        return responses
+
+    def lookup(self, path, quantile=DEFAULT_QUANTILE):
+        # The precomputed response for a request path, or an error response
+        parts = [part for part in path.split('/') if part]
+        if not parts or parts[0] != ROUTE_PREFIX or len(parts) > 3:
+            return error(404, f'Unknown path {path}')
+        date = parts[1] if len(parts) > 1 else 'current'
+        series = parts[2] if len(parts) > 2 else None
+        response = self.responses.get((date, series, quantile))
+        if response is None:
+            if not self.responses:
+                return error(503, 'No forecast available yet')
+            if quantile != DEFAULT_QUANTILE:
+                return error(404, f'Quantile {quantile} is not forecast, only {DEFAULT_QUANTILE}')
+            return error(404, f'No suggestion for {"/".join(parts[1:])}')
+        return response
+
+    def respond(self, path, quantile=DEFAULT_QUANTILE, if_none_match=None):
+        # Lambda result for a GET, 304 with no body when the client holds the current ETag
+        response = self.lookup(path, quantile)
+        if response.status == 200 and response.matches(if_none_match):
+            return response.not_modified
+        return response.result
+
+
+# The index lives as long as the lambda container, every warm invocation reuses it
+INDEX = None
+
+
+def get_index():
+    global INDEX
+    if INDEX is None:
+        if environ.get('STORAGE_ROOT'):
+            storage = LocalStorage(environ['STORAGE_ROOT'])
+        else:
+            storage = S3Storage(environ['FORECAST_BUCKET'])
+        INDEX = SuggestionIndex(storage)
+    return INDEX
+
+
+def lambda_handler(event, context):
+    # API Gateway HTTP API (payload 2.0) or REST API event
+    index = get_index()
+    index.refresh()
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    query = event.get('queryStringParameters') or {}
+    return index.respond(
+        event.get('rawPath') or event.get('path') or '/',
+        query.get('quantile', DEFAULT_QUANTILE),
+        headers.get('if-none-match')
+    )
+
+
+def make_handler(index):
+    # http.server request handler answering from index, for local development and load tests
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qs
+
+    class SuggestionHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            index.refresh()
+            url = urlsplit(self.path)
+            quantile = parse_qs(url.query).get('quantile', [DEFAULT_QUANTILE])[0]
+            response = index.lookup(url.path, quantile)
+            not_modified = response.status == 200 and response.matches(self.headers.get('If-None-Match'))
+            body = b'' if not_modified else response.body
+            self.send_response(304 if not_modified else response.status)
+            for name, value in response.headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SuggestionHandler
+
+
+if __name__ == "__main__":
+    # PYTHONPATH=shared/python python3 lambdas/bidserver/bidserver.py --root <directory holding current/>
+    import argparse
+    from http.server import ThreadingHTTPServer
+    parser = argparse.ArgumentParser(description="Serve the bid suggestions of a local directory or bucket")
+    parser.add_argument('--root', help='directory holding current/ and history/clean/')
+    parser.add_argument('--bucket', help='serve this bucket instead of --root')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    local_index = SuggestionIndex(S3Storage(args.bucket) if args.bucket else LocalStorage(args.root))
+    local_index.refresh()
+    print(f'Serving on http://localhost:{args.port}/{ROUTE_PREFIX}')
+    ThreadingHTTPServer(('', args.port), make_handler(local_index)).serve_forever()
@@ -1,22 +1,36 @@
 from os import environ
-from boto3 import client
 import actions
 from loader import Loader
+from clients import get_client
 
-ACCOUNTID = client('sts').get_caller_identity()['Account']
+ACCOUNTID = None
 ARN = 'arn:aws:forecast:{region}:{account}:dataset/{name}'
 LOADER = Loader()
 
 
+def account_id(context=None):
+    # Looked up once per container on the first invocation, not at import. The account is
+    # part of the invoked function's arn (arn:aws:lambda:<region>:<account>:function:<name>),
+    # sts is only called when there is no lambda context.
+    global ACCOUNTID
+    if ACCOUNTID is None:
+        arn = getattr(context, 'invoked_function_arn', None)
+        if arn:
+            ACCOUNTID = arn.split(':')[4]
+        else:
+            ACCOUNTID = get_client('sts').get_caller_identity()['Account']
+    return ACCOUNTID
+
+
 def lambda_handler(event, context):
     datasets = event['params']['Datasets']
     status = None
     event['DatasetArn'] = ARN.format(
-        account=ACCOUNTID,
+        account=account_id(context),
         name=datasets[0]['DatasetName'],
         region=environ['AWS_REGION']
     )
-    event['AccountID'] = ACCOUNTID
+    event['AccountID'] = account_id()
     try:
         status = LOADER.forecast_cli.describe_dataset(
             DatasetArn=event['DatasetArn']
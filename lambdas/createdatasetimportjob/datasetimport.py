@@ -1,5 +1,6 @@
 from os import environ
 import actions
+import estimator
 from loader import Loader
 
 ARN = 'arn:aws:forecast:{region}:{account}:dataset-import-job/{name}/{name}_{date}'
@@ -48,5 +49,7 @@ def lambda_handler(event, context):
             DatasetImportJobArn=event['DatasetImportJobArn']
         )
 
-    actions.take_action(status['Status'])
+    event['WaitSeconds'] = actions.wait_seconds(
+        status, 'DatasetImportJob', estimator.for_bucket(event['bucket'])
+    )
     return event
@@ -1,53 +1,37 @@
 from os import environ
-from boto3 import client
 import actions
+import estimator
 from loader import Loader
+from publisher import MetricPublisher
 
-CLOUDWATCH_CLI = client('cloudwatch')
+METRIC_NAMESPACE = 'FORECAST'
 ARN = 'arn:aws:forecast:{region}:{account}:forecast/{name}'
 JOB_ARN = 'arn:aws:forecast:{region}:{account}:forecast-export-job/' \
           '{name}/{name}_{date}'
 LOADER = Loader()
+# Its cloudwatch client comes from the shared client cache on first use
+PUBLISHER = MetricPublisher(METRIC_NAMESPACE)
 
 
-# Post training accuracy metrics from the previous step (predictor) to CloudWatch
-def post_metric(metrics):
-    # print(dumps(metrics))
+# Post training accuracy metrics from the previous step (predictor) to CloudWatch.
+# Every algorithm's WQL per quantile and RMSE are collected first and sent in as few
+# put_metric_data calls as possible (or as EMF log lines, see publisher.py).
+def post_metric(metrics, publisher=PUBLISHER):
     for metric in metrics['PredictorEvaluationResults']:
-        CLOUDWATCH_CLI.put_metric_data(
-            Namespace='FORECAST',
-            MetricData=[
-                {
-                    'Dimensions':
-                        [
-                            {
-                                'Name': 'Algorithm',
-                                'Value': metric['AlgorithmArn']
-                            }, {
-                                'Name': 'Quantile',
-                                'Value': str(quantile['Quantile'])
-                            }
-                        ],
-                    'MetricName': 'WQL',
-                    'Unit': 'None',
-                    'Value': quantile['LossValue']
-                } for quantile in metric['TestWindows'][0]['Metrics']
-                ['WeightedQuantileLosses']
-            ] + [
-                {
-                    'Dimensions':
-                        [
-                            {
-                                'Name': 'Algorithm',
-                                'Value': metric['AlgorithmArn']
-                            }
-                        ],
-                    'MetricName': 'RMSE',
-                    'Unit': 'None',
-                    'Value': metric['TestWindows'][0]['Metrics']['RMSE']
-                }
-            ]
-        )
+        windows = metric.get('TestWindows', [])
+        for index, window in enumerate(windows):
+            dimensions = {'Algorithm': metric['AlgorithmArn']}
+            # The summary window (the first one unless flagged) keeps the plain Algorithm
+            # dimensions, every other backtest window is told apart by its start
+            summary = window.get('EvaluationType', 'SUMMARY' if index == 0 else 'COMPUTED') == 'SUMMARY'
+            if not summary and 'TestWindowStart' in window:
+                dimensions['TestWindowStart'] = str(window['TestWindowStart'])
+            for quantile in window['Metrics'].get('WeightedQuantileLosses', []):
+                publisher.add('WQL', quantile['LossValue'], dict(dimensions, Quantile=quantile['Quantile']))
+            if window['Metrics'].get('RMSE') is not None:
+                publisher.add('RMSE', window['Metrics']['RMSE'], dimensions)
+    calls = publisher.flush()
+    LOADER.logger.info(f'Posted predictor metrics with {calls} put_metric_data calls')
 
 
 def lambda_handler(event, context):
@@ -65,13 +49,15 @@ def lambda_handler(event, context):
         region=environ['AWS_REGION']
     )
 
+    durations = estimator.for_bucket(event['bucket'])
+
     # Creates Forecast and export Predictor metrics if Forecast does not exist yet.
-    # Will throw an exception while the forecast is being created.
+    # Returns with a WaitSeconds while the forecast is being created.
     try:
-        actions.take_action(
+        event['WaitSeconds'] = actions.wait_seconds(
             LOADER.forecast_cli.describe_forecast(
                 ForecastArn=event['ForecastArn']
-            )['Status']
+            ), 'Forecast', durations
         )
     except LOADER.forecast_cli.exceptions.ResourceNotFoundException:
         post_metric(
@@ -83,13 +69,15 @@ def lambda_handler(event, context):
         LOADER.forecast_cli.create_forecast(
             **forecast, PredictorArn=event['PredictorArn']
         )
-        actions.take_action(
+        event['WaitSeconds'] = actions.wait_seconds(
             LOADER.forecast_cli.describe_forecast(
                 ForecastArn=event['ForecastArn']
-            )['Status']
+            ), 'Forecast', durations
         )
+    if event['WaitSeconds']:
+        return event
 
-    # Creates forecast export job if it does not exist yet. Will trhow an exception
+    # Creates forecast export job if it does not exist yet. Returns with a WaitSeconds
     # while the forecast export job is being created.
     try:
         status = LOADER.forecast_cli.describe_forecast_export_job(
@@ -116,5 +104,7 @@ def lambda_handler(event, context):
             ForecastExportJobArn=event['ForecastExportJobArn']
         )
 
-    actions.take_action(status['Status'])
+    event['WaitSeconds'] = actions.wait_seconds(
+        status, 'ForecastExportJob', durations
+    )
     return event
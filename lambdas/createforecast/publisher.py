@@ -0,0 +1,95 @@
+import json
+import time
+from os import environ
+from concurrent.futures import ThreadPoolExecutor
+
+# Collects CloudWatch metric data and publishes it in as few calls as possible: one
+# put_metric_data call carries up to BATCH_SIZE data (the API limit is 1000 per call and
+# 1 MB per request), and the calls are sent concurrently. With METRICS_MODE=emf nothing is
+# sent at all: the data is printed as Embedded Metric Format log lines, which CloudWatch
+# turns into the same metrics from the lambda's log stream.
+METRICS_MODE = environ.get('METRICS_MODE', 'api')
+BATCH_SIZE = int(environ.get('METRICS_BATCH_SIZE', 1000))
+MAX_WORKERS = 4
+# EMF documents hold at most 100 metric values
+EMF_MAX_METRICS = 100
+
+
+class MetricPublisher:
+    def __init__(self, namespace, mode=METRICS_MODE, client=None, batch_size=BATCH_SIZE, workers=MAX_WORKERS):
+        self.namespace = namespace
+        self.mode = mode
+        self.batch_size = batch_size
+        self.workers = workers
+        self._client = client
+        self.data = []
+
+    @property
+    def client(self):
+        if self._client is None:
+            from clients import get_client
+            self._client = get_client('cloudwatch')
+        return self._client
+
+    def add(self, name, value, dimensions, unit='None'):
+        # dimensions is an ordered {name: value} dict
+        self.data.append({
+            'Dimensions': [{'Name': key, 'Value': str(val)} for key, val in dimensions.items()],
+            'MetricName': name,
+            'Unit': unit,
+            'Value': value
+        })
+
+    def batches(self):
+        return [self.data[i:i + self.batch_size] for i in range(0, len(self.data), self.batch_size)]
+
+    def put_batch(self, batch):
+        self.client.put_metric_data(Namespace=self.namespace, MetricData=batch)
+
+    def emf_records(self):
+        # One EMF document per dimension set, dimension values are top level keys next to the metric values
+        groups = {}
+        for datum in self.data:
+            dimensions = tuple((d['Name'], d['Value']) for d in datum['Dimensions'])
+            groups.setdefault(dimensions, []).append(datum)
+        records = []
+        timestamp = int(time.time() * 1000)
+        for dimensions, data in groups.items():
+            for i in range(0, len(data), EMF_MAX_METRICS):
+                values, units = {}, {}
+                for datum in data[i:i + EMF_MAX_METRICS]:
+                    values.setdefault(datum['MetricName'], []).append(datum['Value'])
+                    units[datum['MetricName']] = datum['Unit']
+                record = {
+                    '_aws': {
+                        'Timestamp': timestamp,
+                        'CloudWatchMetrics': [{
+                            'Namespace': self.namespace,
+                            'Dimensions': [[name for name, _ in dimensions]],
+                            'Metrics': [{'Name': name, 'Unit': unit} for name, unit in units.items()]
+                        }]
+                    }
+                }
+                record.update(dimensions)
+                record.update({name: vals[0] if len(vals) == 1 else vals for name, vals in values.items()})
+                records.append(record)
+        return records
+
+    def flush(self):
+        # Publish everything collected, returns the number of api calls made
+        if not self.data:
+            return 0
+        if self.mode == 'emf':
+            for record in self.emf_records():
+                print(json.dumps(record, separators=(',', ':')))
+            self.data = []
+            return 0
+        batches = self.batches()
+        if len(batches) == 1:
+            self.put_batch(batches[0])
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(batches))) as pool:
+                # list() raises the first failed call's exception
+                list(pool.map(self.put_batch, batches))
+        self.data = []
+        return len(batches)
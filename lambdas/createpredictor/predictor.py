@@ -1,5 +1,6 @@
 from os import environ
 import actions
+import estimator
 from loader import Loader
 
 ARN = 'arn:aws:forecast:{region}:{account}:predictor/{name}'
@@ -35,5 +36,7 @@ def lambda_handler(event, context):
         status = LOADER.forecast_cli.describe_predictor(
             PredictorArn=event["PredictorArn"]
         )
-    actions.take_action(status['Status'])
+    event['WaitSeconds'] = actions.wait_seconds(
+        status, 'Predictor', estimator.for_bucket(event['bucket'])
+    )
     return event
@@ -1,27 +1,93 @@
 from os import environ
-import boto3
 import datetime
 import sys
-import json
 import numpy as np
-from dateutil.relativedelta import relativedelta
-import pandas as pd
-import io
-
-FILE_NAME_TIME_FORMAT = "%Y_%m_%d"
-DATA_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
-TS = "Timestamp"
-C4 = "c4.8xlarge"
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from trainstore import TRAIN_COLUMNS, upsert_week, mark_ready
+from metrics import Metrics
+# Transform core, storage and raw format are shared with Scripts/ through the shared layer
+from rawevents import RAW_EXTENSION, RawEventSummary, encode_record, open_raw_writer
+from pricestats import events_from_trans_raw, rollup
+from storage import LocalStorage, S3Storage
+from clients import get_client
+from pricetransform import (
+    DATA_TIME_FORMAT, TS, C4, PRICE_FORMAT, DAYS_IN_WEEK, generateTransRawBySeries, seriesLabel,
+    transformDataToDict, transformEventsToWeeklyQuartiles, transformSketchToWeeklyQuartiles, dict_to_csv
+)
+from pricesketch import PriceSketch
+
+MAX_RESULTS = 1000
+# Series are (InstanceType, AvailabilityZone, ProductDescription). Every combination of the configured
+# values is extracted in one api sweep, the training series is always one of them.
+TRAIN_SERIES = (C4, 'us-west-2a', 'Linux/UNIX')
+SERIES = [
+    (instance_type, zone, product)
+    for instance_type in environ.get('INSTANCE_TYPES', TRAIN_SERIES[0]).split(',')
+    for zone in environ.get('AVAILABILITY_ZONES', TRAIN_SERIES[1]).split(',')
+    for product in environ.get('PRODUCT_DESCRIPTIONS', TRAIN_SERIES[2]).split(',')
+]
+if TRAIN_SERIES not in SERIES:
+    SERIES.insert(0, TRAIN_SERIES)
+SPOT_PRICE_FILTERS = [
+    {
+        'Name' : 'availability-zone',
+        'Values' : sorted({zone for _, zone, _ in SERIES})
+    },
+    {
+        'Name' : 'product-description',
+        'Values' : sorted({product for _, _, product in SERIES})
+    }
+]
+# Raw data is buffered in memory up to this size, then spooled to /tmp
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Rollup stage configuration: bucket length per granularity, and the statistics written for every bucket
+ROLLUP_PERIODS = {
+    'hourly': np.timedelta64(1, 'h'),
+    'daily': np.timedelta64(1, 'D'),
+    'weekly': np.timedelta64(7, 'D')
+}
+ROLLUP_TIME_FORMATS = {'hourly': DATA_TIME_FORMAT, 'daily': '%Y-%m-%d', 'weekly': '%Y-%m-%d'}
+ROLLUP_GRANULARITIES = environ.get('ROLLUP_GRANULARITIES', 'hourly,daily,weekly').split(',')
+ROLLUP_QUANTILES = tuple(float(q) for q in environ.get('ROLLUP_QUANTILES', '0.25,0.5,0.75').split(','))
+ROLLUP_STATISTICS = environ.get('ROLLUP_STATISTICS', 'min,mean,std,max,changes').split(',')
+# Rollups get their own root, transformed/rollup/<granularity>/, apart from transformed/weekly/
+ROLLUP_PREFIX = 'transformed/rollup'
+QUANTILE_IDS = {0.25: 'q1', 0.5: 'q2', 0.75: 'q3'}
 UPLOAD_BUCKET = environ['FORECAST_BUCKET']
-
-S3_CLI = boto3.client('s3')
-EC2_CLI = boto3.client('ec2')
-S3 = boto3.resource('s3')
-
-
-def default_converter(o):
-    if isinstance(o, datetime.datetime):
-        return o.__str__()
+TRAIN_PARQUET = environ.get('TRAIN_PARQUET', 'false').lower() == 'true'
+# Backfill runs (an event or command line with a start date) process this many weeks at a time
+BACKFILL_WORKERS = int(environ.get('BACKFILL_WORKERS', '4'))
+BACKFILL_DATE_FORMAT = '%Y-%m-%d'
+# Most weeks one backfill event may cover, so the run ends within the lambda's timeout. The API
+# only serves the last 90 days anyway; larger ranges go through the command line, which has no cap.
+MAX_BACKFILL_WEEKS = int(environ.get('MAX_BACKFILL_WEEKS', '13'))
+# Daily partials: every day is folded into one PriceSketch per series under SKETCH_PREFIX, and with
+# WEEKLY_FROM_PARTIALS the weekly run merges the week's seven partials instead of extracting the week
+SKETCH_PREFIX = 'sketches/daily'
+WEEKLY_FROM_PARTIALS = environ.get('WEEKLY_FROM_PARTIALS', 'false').lower() == 'true'
+
+# Clients come from the shared client cache on first use, boto3 is never imported at cold start
+S3_CLI = None
+EC2_CLI = None
+# Stage timings and counters of the current invocation, flushed as one EMF log line
+METRICS = Metrics()
+
+
+def s3_client():
+    global S3_CLI
+    if S3_CLI is None:
+        S3_CLI = get_client('s3')
+    return S3_CLI
+
+def ec2_client():
+    global EC2_CLI
+    if EC2_CLI is None:
+        EC2_CLI = get_client('ec2')
+    return EC2_CLI
+
+# Everything is written to the bucket, or below STORAGE_ROOT to run the pipeline against a local directory
+STORAGE = LocalStorage(environ['STORAGE_ROOT']) if environ.get('STORAGE_ROOT') else S3Storage(UPLOAD_BUCKET, s3_client)
 
 def get_First_Moment_of_Day(date):
     fm = date.replace(hour=0).replace(minute=0).replace(second=0).replace(microsecond=0)
@@ -31,299 +97,417 @@ def get_Last_Moment_of_Day(date):
     lm = date.replace(hour=23).replace(minute=59).replace(second=59).replace(microsecond=999999)
     return lm
 
-def load_trigger_pipeline(data_frame, key):
-    # Instantiate StringIO objects to act as files
-    forDf1 = io.StringIO()
-    forDf2 = io.StringIO()
-    buffer = io.StringIO()
-    # Retrieve bucket as resource object
-    Bucket = S3.Bucket(UPLOAD_BUCKET)
-    # Empty data frame 
-    old_df = None
-    # Generate list of objects in bucket
-    prefix_objs = Bucket.objects.filter(Prefix="train/")
-    # There may be up to one object in prefix
-    if prefix_objs:
-        # Log all objects in train/ prefix
-        print(f"The following objects exist in {UPLOAD_BUCKET} prior to LOAD")
-        for obj in prefix_objs:
-            old_key = obj.key
-            # Log key
-            print(f'\t{old_key}')
-            # Move on if not a csv file
-            if not old_key.endswith('.csv') and not old_key.endswith('.CSV'):
-                continue
-            else:
-                print("Previous training data loading...")
-                body = obj.get()['Body'].read()
-                old_df = pd.read_csv(io.BytesIO(body), encoding='utf8', index_col=0)
-                break
-    # Delete all objects of prefix train/
-    print("Deleting previous objects")
-    prefix_objs.delete()
-    print("Concatenating training data with recent data")
-    # Add new data to old training data if it exists
-    if isinstance(old_df, pd.DataFrame):
-        old_df.to_csv(forDf1)
-        data_frame.to_csv(forDf2)
-        csv1 = forDf1.getvalue()
-        csv2 = forDf2.getvalue()
-        csv2 = csv2.split("\n",1)[1]
-        newcsv = f'{csv1}{csv2}'
-        training_df = pd.read_csv(io.StringIO(newcsv), index_col=0)
-    else:
-        training_df = data_frame
-    training_df.to_csv(buffer)
+def trigger_pipeline(week_keys):
+    # Writing the ready marker starts the MLOps pipeline once, whatever the number of weeks loaded
+    mark_ready(STORAGE, week_keys)
+    print(f'Training data ready, pipeline triggered for {len(week_keys)} loaded weeks')
+
+def load_trigger_pipeline(quartile_dict, key, trigger=True):
+    # Returns True when the week was loaded. With trigger=False the pipeline is left for the
+    # caller to trigger once, after its last week.
+    # Serialize this week's quartiles exactly like the transformed/weekly/quartiles csv
+    csv_body = dict_to_csv(quartile_dict)
+    # Optional columnar copy of the week, importable by Forecast as a PARQUET prefix.
+    # Only this option needs pandas (and pyarrow), so it is imported here and not at cold start.
+    parquet_body = None
+    if TRAIN_PARQUET:
+        import io
+        import pandas as pd
+        parquet_buffer = io.BytesIO()
+        pd.DataFrame(quartile_dict).set_axis(TRAIN_COLUMNS, axis=1).to_parquet(parquet_buffer, index=False)
+        parquet_body = parquet_buffer.getvalue()
 
     # Log training data
-    print(f'Abbreviated training DataFrame\n{training_df}')
-    
-    # Write new training data to train/ prefix
-    writeToBucket(buffer.getvalue(), UPLOAD_BUCKET, "train", f'{key}.csv')
-
-    
-    
-
-
-def transform_write_data(raw_data, start_time, key):
+    print(f'Training data for week {key}\n{csv_body}')
+
+    # Upsert the week's object into the train/ prefix
+    with METRICS.timer('Load'):
+        loaded = upsert_week(STORAGE, key, csv_body, len(quartile_dict[TS]), parquet_body)
+    if loaded:
+        METRICS.add('TrainBytesWritten', len(csv_body), 'Bytes')
+        if trigger:
+            trigger_pipeline([key])
+    else:
+        print(f'Training data already contains week {key}, nothing loaded')
+    return loaded
 
-    transition_raw = generateTransRaw(raw_data, start_time)
-    # Log Transitional Data
-    print(f'Tranformation from raw data to parsable dictionary\n{transition_raw}')
 
-    time_series_dict = transformDataToDict(start_time, transition_raw)
+def transform_write_data(transition_raw, start_time, key, series=TRAIN_SERIES):
 
-    # Now time series dict is in a form to create a pandas data frame
-    df = pd.DataFrame(time_series_dict)
+    # Log a summary of the transitional data, the full dict goes to the minute csv anyway
+    print(f'Tranformation from raw data to parsable dictionary for {seriesLabel(series)}: '
+          f'{len(transition_raw)} price changes, {min(transition_raw)} - {max(transition_raw)}')
 
-    # Set the Timestamp column as the dataframe index
-    df.set_index(TS, inplace=True)
+    # The training series keeps its instance type as the id column, others are labelled in full
+    series_id = series[0] if series == TRAIN_SERIES else seriesLabel(series)
+    with METRICS.timer('Transform'):
+        time_series_dict = transformDataToDict(start_time, transition_raw, series_id)
 
-    print(f'Abreviated Time Series DataFrame in minutes\n{df}')
+    # Write time series to bucket as csv, prices at the raw data's 6 decimal precision
+    with METRICS.timer('WriteMinute'):
+        body = write_dict_as_csv(time_series_dict, seriesPrefix("transformed/weekly/minute", series), f'{key}.csv', float_format=PRICE_FORMAT)
 
-    # Write dataframe to bucket as csv
-    write_df_as_csv(df, "transformed/weekly/minute", f'{key}.csv')
+    lines = body.splitlines()
+    print(f'Abreviated Time Series in minutes ({len(lines)} rows)\n{lines[0]}\n...\n{lines[-1]}')
 
-    # Transform again but into weekly quartile values
+    # Transform again but into weekly quartile values, computed from the price change events
     # Time-series timestamp, spot-price target_value, quartiles-value item_id 
-    quartile_dict = transformFromMinIncrementToWeeklyQuartiles(time_series_dict)
-
-    # Transform quartile dictionary to pandas dataframe
-    df = pd.DataFrame(quartile_dict)
-
-    # Set the Timestamp column as the dataframe index
-    df.set_index(TS, inplace=True)
-
-    print(f'Weekly quartiles DataFrame generated from Time Series in minutes\n{df}')
-
-    # Write dataframe to bucket prefix as csv
-    write_df_as_csv(df, "transformed/weekly/quartiles", f'{key}.csv')
-
-    # Return quartile data frame
-    return df
-
-def transformFromMinIncrementToWeeklyQuartiles(minuteIncDict):
-    # Clean up time stamp
-    ts = minuteIncDict[TS][0].split(' ')[0]
-    # Instantiate a dictionary to track quartiles
-    quartDict = {TS : [ts]*4}
-    # Instantiate a numpy array of the SpotPrice column of the minuteIncDict
-    priceList = np.array(minuteIncDict['SpotPrice'])
-    # Convert all strings in numpy array to float64
-    conv_priceList = priceList.astype(np.float64)
-    # Retrieve the first 3 quartiles and max value of the SpotPrice values of the numpy array
-    q1 = np.quantile(conv_priceList, 0.25)
-    q2 = np.quantile(conv_priceList, 0.5)
-    q3 = np.quantile(conv_priceList, 0.75)
-    max = np.max(conv_priceList)
-    # Assign the quartiles and quartile IDs as lists to dictionary keys
-    quartDict['SpotPrice'] = [q1, q2, q3, max]
-    quartDict['q_id'] = ['q1', 'q2', 'q3', 'max']
-    # Return the quartile dictionary
-    return quartDict
+    with METRICS.timer('Quartiles'):
+        quartile_dict = transformEventsToWeeklyQuartiles(start_time, transition_raw)
+
+    # Write quartiles to bucket prefix as csv
+    with METRICS.timer('WriteQuartiles'):
+        body = write_dict_as_csv(quartile_dict, seriesPrefix("transformed/weekly/quartiles", series), f'{key}.csv')
+
+    print(f'Weekly quartiles generated from Time Series in minutes\n{body}')
+
+    # Roll the same events up into every configured granularity
+    with METRICS.timer('Rollup'):
+        rollup_write_data(transition_raw, start_time, key, series=series)
+
+    # Return quartile data
+    return quartile_dict
+
+def quantileId(quantile):
+    # Quartiles keep the q1/q2/q3 item_ids of the training data, other quantiles are named like p10, p90
+    return QUANTILE_IDS.get(quantile, 'p{:g}'.format(quantile * 100))
+
+def transformEventsToRollupRows(starting_dt, tr_dict, granularity, days=DAYS_IN_WEEK,
+                                quantiles=ROLLUP_QUANTILES, statistics=ROLLUP_STATISTICS, unit='m'):
+    # Duration weighted rollup of the price change events into hourly, daily or weekly buckets.
+    # Rows are <timestamp>,<value>,<statistic id>, grouped by bucket like the weekly quartiles csv
+    times, prices = events_from_trans_raw(tr_dict, unit)
+    end = starting_dt + datetime.timedelta(days=days)
+    stats = rollup(times, prices, starting_dt, end, ROLLUP_PERIODS[granularity], quantiles, unit)
+    # Plain python floats/ints so values are written exactly like the pandas csv writers do
+    columns = [(quantileId(q), stats['quantiles'][i].tolist()) for i, q in enumerate(quantiles)]
+    columns += [(name, stats[name].tolist()) for name in statistics]
+    time_format = ROLLUP_TIME_FORMATS[granularity]
+    rows = []
+    for b, bucket_start in enumerate(stats['start'].astype('datetime64[s]').tolist()):
+        ts = bucket_start.strftime(time_format)
+        rows.extend(f'{ts},{values[b]},{stat_id}' for stat_id, values in columns)
+    return rows
+
+def rollup_write_data(transition_raw, start_time, key, granularities=ROLLUP_GRANULARITIES, series=TRAIN_SERIES):
+    # Every granularity is computed from the same price change events and written to its own prefix
+    for granularity in granularities:
+        rows = transformEventsToRollupRows(start_time, transition_raw, granularity)
+        print(f'{granularity} rollup: {len(rows)} rows')
+        prefix = seriesPrefix(f'{ROLLUP_PREFIX}/{granularity}', series)
+        writeToBucket('\n'.join(rows) + '\n', UPLOAD_BUCKET, prefix, f'{key}.csv')
 
 def writeToBucket(body, bucket, prefix, key):
-    # Upload object to bucket using prefix to generate key
-    S3_CLI.put_object(Body=body, Bucket=bucket, Key=f'{prefix}/{key}')
+    # Upload object to the pipeline's storage (the bucket) using prefix to generate key
+    STORAGE.write(f'{prefix}/{key}', body)
+    METRICS.add('ObjectsWritten', 1)
+    # File like bodies (the raw data spool) are measured by their writer
+    if isinstance(body, (str, bytes)):
+        METRICS.add('BytesWritten', len(body), 'Bytes')
 
 
-def write_df_as_csv(data_frame, prefix, objKey):
-    csv_buffer = io.StringIO()
-    data_frame.to_csv(csv_buffer, header=False)
-    body = csv_buffer.getvalue()
+def write_dict_as_csv(data, prefix, objKey, float_format=None):
+    # Write a dict of columns to the bucket as a headerless csv, returns the csv text
+    body = dict_to_csv(data, float_format)
     writeToBucket(body, UPLOAD_BUCKET, prefix, objKey)
+    return body
 
-def transformDataToDict(starting_dt, tr_dict, instanceType=C4):
-    # Initiate a dictionary to build record of instance prices
-    temp_ts_dict = {TS: [], "SpotPrice": [], "InstanceType": []}
-    # Some variables to use for transform
-    MN = 60
-    HR = 24
-    DAYS = 7
-    prevPrice = None
-
-    # Iterating for every minute in a week
-    for i in range(MN*HR*DAYS):
-        # Incrementing datetime in every iteration
-        time = (starting_dt + datetime.timedelta(minutes=i)).strftime(DATA_TIME_FORMAT)
-        # Checking the tr_dict for a price change at this increment
-        listedPrice = tr_dict.get(time)
-        # If a price change exists, update price and previous price
-        if listedPrice:
-            price = listedPrice
-            prevPrice = price
-        # If no price change exists, use previous minutes price
-        else:
-            price = prevPrice
-        # Quick sanity check for error
-        if not price:
-            print("Big Problem")
-            raise NameError("No Price")
-            
-        # Once price is established, update time, price and instance type (id)
-        temp_ts_dict[TS].append(time)
-        temp_ts_dict["SpotPrice"].append(price)
-        temp_ts_dict["InstanceType"].append(instanceType)
-    # Return fully built record
-    return temp_ts_dict
-
-def generateTransRaw(rawData, startDate):
-    # Instantiate dictionary to record price and time of price change for instance type
-    tr = {}
-    # Raw data is a list of json objects represting price and time of price change
-    # Iterate over each element in the list, transorm the data into easily parseable tr dict
-    for elm in rawData:
-        # Some data may include instance types other than c4.8xlarge, if so skip it
-        if elm["InstanceType"] != C4:
-            continue
-        # Convert time entries to strings
-        reformedDT = None
-        # Strip timezone data from Timestamp in raw data
-        elm[TS] = elm[TS].strftime(DATA_TIME_FORMAT).split('+')[0]
-        # Get the datetime of the current elm's spot price change
-        elm_datetime = datetime.datetime.strptime(elm[TS], DATA_TIME_FORMAT)
-        # If the spot price change is prior to start time (midnight) then update to midnight
-        if elm_datetime < startDate:
-            reformedDT = startDate.strftime(DATA_TIME_FORMAT)
-            tr[reformedDT] = elm.get('SpotPrice')
-            continue
-        # For every price change that occurs mid minute, forward fill to top of next minute
-        if elm_datetime.second != 0:
-            upDate = elm_datetime + datetime.timedelta(minutes=1)
-            upDate = upDate.replace(second=0)
-            elm[TS] = upDate.strftime(DATA_TIME_FORMAT)
-        # Assign the price value to the datetime string key of tr dict
-        tr[elm[TS]] = elm.get('SpotPrice')
-    # Return tr once raw data cleaned/converted
-    return tr
+def seriesPrefix(prefix, series):
+    # The training series keeps the original keys, every other series gets its own sub prefix
+    return prefix if series == TRAIN_SERIES else f'{prefix}/{seriesLabel(series)}'
 
-def extract_data(startTime, stopTime):
+def iter_spot_price_pages(startTime, stopTime):
     # The sdk call describe_spot_price_history is paginated.
     # Using the first and last moment of the interval of interest
-    # to retrieve all spot price data for the interval.
-    max_results=1000
-    instance_types = ['c4.8xlarge']
-    filters = [
-                            {
-                                'Name' : 'availability-zone',
-                                'Values' : [
-                                    'us-west-2a'
-                                ]
-                            },
-                            {
-                                'Name' : 'product-description',
-                                'Values' : [
-                                    'Linux/UNIX'
-                                ]
-                            }
-                        ]
-    try:
-        data_out = []
-        nOfCalls = 0
-        response = EC2_CLI.describe_spot_price_history(
-            Filters=filters, 
-            DryRun=False,
-            EndTime=stopTime,
-            InstanceTypes=instance_types,
-            MaxResults=max_results,
-            StartTime=startTime
-        )
-        # First page of data assigned to data out
-        data_out = response.get('SpotPriceHistory')
+    # to retrieve all spot price data for the interval, one page at a time.
+    # Each page is yielded and then dropped, so memory does not grow with the number of pages.
+    request = dict(
+        Filters=SPOT_PRICE_FILTERS,
+        DryRun=False,
+        EndTime=stopTime,
+        InstanceTypes=sorted({instance_type for instance_type, _, _ in SERIES}),
+        MaxResults=MAX_RESULTS,
+        StartTime=startTime
+    )
+    nOfCalls = 0
+    while True:
+        response = ec2_client().describe_spot_price_history(**request)
+        nOfCalls += 1
+        page = response.get('SpotPriceHistory', [])
+        METRICS.add('Pages', 1)
+        METRICS.add('Records', len(page))
+        print(f'Page {nOfCalls}: {len(page)} records')
+        yield page
+        # Advance to the next page until there are no more
         pagination_token = response.get('NextToken')
-        while(pagination_token):
-            response = EC2_CLI.describe_spot_price_history(
-                Filters=filters,
-                DryRun=False,
-                EndTime=stopTime,
-                InstanceTypes=instance_types,
-                MaxResults=max_results,
-                StartTime=startTime,
-                NextToken=pagination_token
-            )
-            # Subsequent pages of data assigned to temporary data
-            data = response.get('SpotPriceHistory')
-            # Current page of data is appended to data_out and deleted
-            data_out = data_out + data
-            del data
-        # Return full raw data list
-        return data_out 
+        if not pagination_token:
+            return
+        request['NextToken'] = pagination_token
+
+def extract_data(startTime, stopTime):
+    # Stream raw records as pages arrive
+    try:
+        for page in iter_spot_price_pages(startTime, stopTime):
+            yield from page
     except Exception as e:
         # If there is any exception, print to stdout so that data is retrieved later
         # print statements log to cloudwatch logs
         print(f'EXCEPTION:{e}')
         sys.exit("RAW DATA EXTRACTION FAILED")
 
-def extract_write_data():
+class RawDataWriter:
+    # Writes raw records to a bucket prefix as gzip compressed NDJSON (see rawevents.py), one
+    # record at a time, while passing them on to the next stage. The compressed bytes are
+    # spooled to disk past SPOOL_MAX_BYTES, no list of records is ever held. Records are
+    # summarized in the log rather than printed.
+    def __init__(self, bucket, prefix, key):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.key = key
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode='w+b')
+        self.gz = open_raw_writer(self.spool)
+        self.summary = RawEventSummary()
+        self.count = 0
+
+    def write(self, record):
+        self.gz.write(encode_record(record))
+        self.summary.add(record)
+        self.count += 1
+
+    def tee(self, records):
+        # Write every record as it passes through
+        for record in records:
+            self.write(record)
+            yield record
+
+    def close(self):
+        # Finish the gzip stream and upload it
+        self.gz.close()
+        size = self.spool.tell()
+        self.spool.seek(0)
+        writeToBucket(self.spool, self.bucket, self.prefix, self.key)
+        METRICS.add('BytesWritten', size, 'Bytes')
+        METRICS.add('RawBytesWritten', size, 'Bytes')
+        self.spool.close()
+        self.summary.log()
+        print(f'Raw Data: {self.count} records, {size} bytes written to {self.prefix}/{self.key}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.gz.close()
+            self.spool.close()
+
+def extract_write_data(beg_interval=None):
 
-    # Determining beginning/end of interval for data to extract
-    current_time = datetime.datetime.now()
-    print(f"Extraction Begins: {current_time.ctime()}")
-    end_interval = get_Last_Moment_of_Day(current_time - datetime.timedelta(1))
-    beg_interval = get_First_Moment_of_Day(current_time - datetime.timedelta(7))
+    # Determining beginning/end of interval for data to extract, by default the 7 days ending yesterday
+    if beg_interval is None:
+        current_time = datetime.datetime.now()
+        print(f"Extraction Begins: {current_time.ctime()}")
+        beg_interval = get_First_Moment_of_Day(current_time - datetime.timedelta(DAYS_IN_WEEK))
+    end_interval = get_Last_Moment_of_Day(beg_interval + datetime.timedelta(DAYS_IN_WEEK - 1))
     
     # Log Collection Interval
     print(f'Collection Interval: {beg_interval.strftime(DATA_TIME_FORMAT)} - {end_interval.strftime(DATA_TIME_FORMAT)}')
-    
-    # Retrieve raw data
-    raw_data = extract_data(beg_interval, end_interval)
-
-    # Turn raw into pretty json
-    raw_pretty = json.dumps(raw_data, indent=4, default=default_converter)
-
-    # Log Raw Data
-    print(f'Raw Data:\n{raw_pretty}')
 
     # Use the beginning datetime (first day of interval) as object key
     obj_key = beg_interval.strftime('%Y_%m_%d')
 
-    # Write raw data to bucket prefix
-    writeToBucket(raw_pretty, UPLOAD_BUCKET, "extracted", f'{obj_key}.json')
-
-    # Return raw data and beginning datetime for further processing
-    return raw_data, beg_interval
+    # Stream raw data from the api through the raw data writer and into the first transform,
+    # extraction, raw writing and transformation overlap page by page.
+    # Records of all series come from one sweep and are partitioned by series on the way.
+    with RawDataWriter(UPLOAD_BUCKET, "extracted", f'{obj_key}.{RAW_EXTENSION}') as raw_writer:
+        transition_by_series = generateTransRawBySeries(raw_writer.tee(extract_data(beg_interval, end_interval)), beg_interval)
+
+    # Return transition data of every series and beginning datetime for further processing
+    return transition_by_series, beg_interval
+
+def sketchKey(day):
+    return f"{day.strftime('%Y_%m_%d')}.json"
+
+def fold_day(day):
+    # Extract one day, write its raw data to "extracted/daily/" and fold every series into a
+    # persisted daily partial. Returns the partials by series.
+    day = get_First_Moment_of_Day(day)
+    next_day = day + datetime.timedelta(1)
+    obj_key = day.strftime('%Y_%m_%d')
+    print(f'Folding day {obj_key} into daily partials')
+    with METRICS.timer('Extract'):
+        with RawDataWriter(UPLOAD_BUCKET, "extracted/daily", f'{obj_key}.{RAW_EXTENSION}') as raw_writer:
+            transition_by_series = generateTransRawBySeries(raw_writer.tee(extract_data(day, get_Last_Moment_of_Day(day))), day)
+    sketches = {}
+    with METRICS.timer('Sketch'):
+        for series in SERIES:
+            transition_raw = transition_by_series.get(series)
+            if not transition_raw:
+                print(f'No price data for {seriesLabel(series)} on {obj_key}, skipping')
+                continue
+            sketch = PriceSketch.from_trans_raw(transition_raw, day, next_day)
+            writeToBucket(sketch.to_json(), UPLOAD_BUCKET, seriesPrefix(SKETCH_PREFIX, series), sketchKey(day))
+            sketches[series] = sketch
+    METRICS.add('Days', 1)
+    return sketches
+
+def read_partial(day, series=TRAIN_SERIES):
+    # The day's persisted partial, the day is folded first when it has none yet
+    key = f'{seriesPrefix(SKETCH_PREFIX, series)}/{sketchKey(day)}'
+    try:
+        return PriceSketch.from_json(STORAGE.read(key))
+    except KeyError:
+        sketch = fold_day(day).get(series)
+        if sketch is None:
+            raise NameError(f"No Price for {seriesLabel(series)} on {day:%Y-%m-%d}")
+        return sketch
+
+def weekly_quartiles_from_partials(week_start, series=TRAIN_SERIES):
+    # The week's quartiles from its seven merged daily partials, identical to the ones
+    # transformEventsToWeeklyQuartiles gives over the whole week's events
+    week_start = get_First_Moment_of_Day(week_start)
+    days = [week_start + datetime.timedelta(i) for i in range(DAYS_IN_WEEK)]
+    sketch = PriceSketch.merge_all(read_partial(day, series) for day in days)
+    week_end = np.datetime64(week_start + datetime.timedelta(DAYS_IN_WEEK), sketch.unit)
+    if not sketch.is_complete() or sketch.start != np.datetime64(week_start, sketch.unit) or sketch.end != week_end:
+        raise ValueError(f'Daily partials of week {week_start:%Y_%m_%d} do not cover the week')
+    return transformSketchToWeeklyQuartiles(week_start, sketch)
+
+def weekly_windows(start, end):
+    # First moment of every full week from the day of start up to and including the day of end
+    week = get_First_Moment_of_Day(start)
+    last_day = get_First_Moment_of_Day(end)
+    windows = []
+    while week + datetime.timedelta(DAYS_IN_WEEK - 1) <= last_day:
+        windows.append(week)
+        week += datetime.timedelta(DAYS_IN_WEEK)
+    return windows
 
 def lambda_handler(event, context):
-    # All print statements are logged by Cloudwatch
+    # All print statements are logged by Cloudwatch, the stage metrics too (as one EMF line)
     # Log event
     if event:
         print(event)
 
-    # Extract/retrieves raw data, writes it to "extracted/" prefix, and returns the data.
-    rData, start_datetime = extract_write_data()
-
-    # Format start_datetime for object key
-    obj_key = start_datetime.strftime('%Y_%m_%d')
+    METRICS.reset()
+    try:
+        with METRICS.timer('Handler'):
+            # {"start": "2021-06-21", "end": "2021-08-01", "workers": 4} backfills every full week of
+            # the range, end defaults to yesterday. {"day": "2021-06-21"} folds one day into its daily
+            # partials, {"mode": "daily"} (the daily schedule) folds yesterday.
+            # The weekly scheduled event has none of these and runs last week.
+            if event and event.get('day'):
+                fold_day(datetime.datetime.strptime(event['day'], BACKFILL_DATE_FORMAT))
+            elif event and event.get('mode') == 'daily':
+                fold_day(datetime.datetime.now() - datetime.timedelta(1))
+            elif event and event.get('start'):
+                start = datetime.datetime.strptime(event['start'], BACKFILL_DATE_FORMAT)
+                if event.get('end'):
+                    end = datetime.datetime.strptime(event['end'], BACKFILL_DATE_FORMAT)
+                else:
+                    end = datetime.datetime.now() - datetime.timedelta(1)
+                backfill(start, end, int(event.get('workers', BACKFILL_WORKERS)), MAX_BACKFILL_WEEKS)
+            else:
+                run_pipeline()
+    finally:
+        METRICS.flush()
 
+    return event
 
-    # Transform data and upload to appropriate prefixes, assign weeks quartile dataframe
-    quartile_df = transform_write_data(rData, start_datetime, obj_key)
+def transform_week(start_datetime=None):
+    # Extract/retrieves raw data, writes it to "extracted/" prefix, and returns it as transition data per series.
+    # Extraction, raw writing and parsing overlap page by page, so they are timed as one stage.
+    with METRICS.timer('Extract'):
+        transition_by_series, start_datetime = extract_write_data(start_datetime)
 
-    # Load data frame to train/ prefix to trigger MLOps pipeline
-    load_trigger_pipeline(quartile_df, obj_key)
+    # Format start_datetime for object key
+    obj_key = start_datetime.strftime('%Y_%m_%d')
 
-    return event
+    # Transform every configured series and upload to appropriate prefixes
+    for series in SERIES:
+        transition_raw = transition_by_series.get(series)
+        if not transition_raw:
+            if series == TRAIN_SERIES:
+                raise NameError(f"No Price for {seriesLabel(series)}")
+            print(f'No price data for {seriesLabel(series)}, skipping')
+            continue
+        METRICS.add('Series', 1)
+        METRICS.add('PriceChanges', len(transition_raw))
+        quartiles = transform_write_data(transition_raw, start_datetime, obj_key, series)
+        # Keep the training series' weekly quartiles
+        if series == TRAIN_SERIES:
+            train_quartiles = quartiles
+
+    # Return the object key and the training series' quartiles, ready to load
+    return obj_key, train_quartiles
+
+def run_pipeline():
+    # The scheduled weekly run: last week is transformed, then loaded to train/ to trigger MLOps pipeline
+    if WEEKLY_FROM_PARTIALS:
+        # Only the daily partials are read, days the daily schedule missed are folded on demand
+        week_start = get_First_Moment_of_Day(datetime.datetime.now() - datetime.timedelta(DAYS_IN_WEEK))
+        obj_key = week_start.strftime('%Y_%m_%d')
+        with METRICS.timer('Quartiles'):
+            train_quartiles = weekly_quartiles_from_partials(week_start)
+        write_dict_as_csv(train_quartiles, "transformed/weekly/quartiles", f'{obj_key}.csv')
+    else:
+        obj_key, train_quartiles = transform_week()
+    load_trigger_pipeline(train_quartiles, obj_key)
+    METRICS.add('Weeks', 1)
+
+def backfill(start, end, workers=BACKFILL_WORKERS, max_weeks=None):
+    # Every full week of [start, end] is extracted and transformed on a bounded thread pool.
+    # Weeks are loaded one at a time in date order, each as soon as it and all earlier weeks
+    # are done, so the training store is only ever written from this thread. The pipeline is
+    # triggered once, after the last week, for all the weeks loaded. A range of more than
+    # max_weeks weeks is rejected before anything is extracted.
+    windows = weekly_windows(start, end)
+    if not windows:
+        raise ValueError(f'No full week between {start:%Y-%m-%d} and {end:%Y-%m-%d}')
+    if max_weeks and len(windows) > max_weeks:
+        raise ValueError(f'{start:%Y-%m-%d} - {end:%Y-%m-%d} has {len(windows)} full weeks, a backfill event '
+                         f'covers at most {max_weeks}: split the range or run python3 etl.py --start ... --end ...')
+    print(f'Backfilling {len(windows)} weeks {windows[0]:%Y-%m-%d} - {windows[-1]:%Y-%m-%d} with {workers} workers')
+    # Clients are shared by the workers (boto3 clients are thread safe), create them before the pool does
+    if isinstance(STORAGE, S3Storage):
+        s3_client()
+    ec2_client()
+    failed = []
+    loaded = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(windows)))) as pool:
+        futures = [pool.submit(transform_week, week) for week in windows]
+        for week, future in zip(windows, futures):
+            try:
+                obj_key, train_quartiles = future.result()
+            except (Exception, SystemExit) as e:
+                # A failed week does not stop the others, it is reported once all are done
+                print(f'Week {week:%Y_%m_%d} failed: {e}')
+                failed.append(week)
+                continue
+            if load_trigger_pipeline(train_quartiles, obj_key, trigger=False):
+                loaded.append(obj_key)
+            METRICS.add('Weeks', 1)
+    if loaded:
+        trigger_pipeline(loaded)
+    METRICS.add('FailedWeeks', len(failed))
+    if failed:
+        raise RuntimeError(f'Backfill failed for weeks {", ".join(f"{week:%Y_%m_%d}" for week in failed)}')
 
 
 if __name__ == "__main__":
-    lambda_handler(None, None)
\ No newline at end of file
+    # python3 etl.py runs last week, python3 etl.py --start 2021-06-21 [--end 2021-08-01] backfills,
+    # python3 etl.py --day 2021-06-21 folds one day into its daily partials
+    import argparse
+    parser = argparse.ArgumentParser(description="Extract, transform and load spot price weeks")
+    parser.add_argument('--start', help=f'first day of a backfill ({BACKFILL_DATE_FORMAT})')
+    parser.add_argument('--end', help=f'last day of a backfill ({BACKFILL_DATE_FORMAT}), default yesterday')
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS, help='weeks processed at a time')
+    parser.add_argument('--day', help=f'day to fold into its daily partials ({BACKFILL_DATE_FORMAT})')
+    args = parser.parse_args()
+    # Not bound by a lambda timeout, so backfills of any length are run
+    MAX_BACKFILL_WEEKS = None
+    if args.day:
+        lambda_handler({'day': args.day}, None)
+    else:
+        lambda_handler({'start': args.start, 'end': args.end, 'workers': args.workers} if args.start else None, None)
@@ -0,0 +1,68 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from os import environ
+
+# Stage timings and counters of one lambda invocation, emitted as a single CloudWatch
+# Embedded Metric Format (EMF) log line. CloudWatch extracts the metrics from the log line
+# itself, so publishing them costs no api calls. The same record can be appended to a
+# local file (METRICS_FILE) to compare runs outside of AWS.
+NAMESPACE = environ.get('METRICS_NAMESPACE', 'BidRipper/ETL')
+METRICS_FILE = environ.get('METRICS_FILE')
+
+
+class Metrics:
+    def __init__(self, namespace=NAMESPACE, dimensions=None, path=METRICS_FILE):
+        self.namespace = namespace
+        self.dimensions = dimensions or {'Function': environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')}
+        self.path = path
+        # Backfill workers add to the same invocation's metrics
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # Values are kept in insertion order as {name: [value, unit]}
+        self.values = {}
+
+    def add(self, name, value, unit='Count'):
+        # Counters accumulate over the invocation, e.g. bytes written by every upload
+        with self.lock:
+            entry = self.values.setdefault(name, [0, unit])
+            entry[0] += value
+
+    @contextmanager
+    def timer(self, stage):
+        # Wall clock milliseconds spent in the block, added to <stage>Time
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(f'{stage}Time', (time.perf_counter() - started) * 1000, 'Milliseconds')
+
+    def record(self):
+        # The EMF document: metric declarations under _aws, values and dimensions at the top level
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [sorted(self.dimensions)],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in self.values.items()]
+                }]
+            }
+        }
+        record.update(self.dimensions)
+        record.update({name: round(value, 3) for name, (value, _) in self.values.items()})
+        return record
+
+    def flush(self):
+        # Print the record (lambda stdout is the log stream) and append it to the local sink
+        if not self.values:
+            return
+        line = json.dumps(self.record(), separators=(',', ':'))
+        print(line)
+        if self.path:
+            with open(self.path, 'a') as mf:
+                mf.write(line + '\n')
+        self.reset()
@@ -0,0 +1,96 @@
+import json
+import datetime
+
+# Training data lives under train/ as one headerless csv object per week, keyed by the
+# week's first day (train/2021_06_21.csv). Forecast imports the whole prefix, so loading
+# a week only ever writes that week's object. A small manifest, kept outside of train/
+# so Forecast never tries to import it, records which object holds every week.
+TRAIN_PREFIX = "train"
+PARQUET_PREFIX = "train_parquet"
+MANIFEST_KEY = "manifests/train.json"
+# The S3 trigger starts the MLOps pipeline when this marker is written, not on every object
+# under train/, so loading many weeks at once (a backfill) starts a single execution
+READY_KEY = "manifests/train.ready"
+TRAIN_COLUMNS = ["timestamp", "target_value", "item_id"]
+WEEK_KEY_FORMAT = "%Y_%m_%d"
+ROW_DATE_FORMAT = "%Y-%m-%d"
+
+
+def partition_key(week_key, extension='csv', prefix=TRAIN_PREFIX):
+    return f'{prefix}/{week_key}.{extension}'
+
+
+def weeks_in_csv(body):
+    # Week keys of every row in a training csv, rows that are not data (headers) are skipped
+    weeks = set()
+    for line in body.splitlines():
+        try:
+            date = datetime.datetime.strptime(line.split(',', 1)[0], ROW_DATE_FORMAT)
+        except ValueError:
+            continue
+        weeks.add(date.strftime(WEEK_KEY_FORMAT))
+    return weeks
+
+
+# Every function takes the pipeline's storage (storage.py), the bucket in the lambda
+
+
+def read_manifest(storage):
+    try:
+        body = storage.read(MANIFEST_KEY)
+    except KeyError:
+        return None
+    return json.loads(body)
+
+
+def write_manifest(storage, manifest):
+    storage.write(MANIFEST_KEY, json.dumps(manifest, indent=4, sort_keys=True))
+
+
+def bootstrap_manifest(storage):
+    # One time scan of train/ for objects written before the partitioned layout,
+    # e.g. the full history trainingData.csv. Their weeks are recorded as they are
+    # so they are never loaded a second time.
+    manifest = {"partitions": {}}
+    for key in storage.list(f'{TRAIN_PREFIX}/'):
+        if not key.lower().endswith('.csv'):
+            continue
+        print(f'Registering existing training object {key}')
+        body = storage.read(key).decode('utf-8')
+        for week in weeks_in_csv(body):
+            manifest["partitions"].setdefault(week, {"key": key})
+    write_manifest(storage, manifest)
+    return manifest
+
+
+def upsert_week(storage, week_key, csv_body, rows, parquet_body=None):
+    # Idempotent load of one week: the week's object is (over)written in place, so
+    # rerunning a week replaces its rows instead of duplicating them.
+    # Returns False when the week is already held by a multi-week object.
+    manifest = read_manifest(storage) or bootstrap_manifest(storage)
+    key = partition_key(week_key)
+    existing = manifest["partitions"].get(week_key)
+    if existing and existing["key"] != key:
+        print(f'{week_key} already loaded in {existing["key"]}, skipping')
+        return False
+    storage.write(key, csv_body)
+    entry = {
+        "key": key,
+        "rows": rows,
+        "bytes": len(csv_body),
+        "updated": datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }
+    if parquet_body is not None:
+        entry["parquet_key"] = partition_key(week_key, 'parquet', PARQUET_PREFIX)
+        storage.write(entry["parquet_key"], parquet_body)
+    manifest["partitions"][week_key] = entry
+    write_manifest(storage, manifest)
+    return True
+
+
+def mark_ready(storage, week_keys):
+    # Signal that the training data is complete and the pipeline should run on it
+    storage.write(READY_KEY, json.dumps({
+        "keys": [partition_key(week_key) for week_key in week_keys],
+        "updated": datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }, indent=4))
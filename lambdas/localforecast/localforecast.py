@@ -0,0 +1,71 @@
+import json
+import time
+from os import environ
+from datetime import timedelta
+from forecasters import forecast
+from storage import LocalStorage, S3Storage
+from trainhistory import TRAIN_PREFIX, ROW_DATE_FORMAT, read_history, history_matrix
+
+# In-process alternative to the Amazon Forecast chain (params.json "Backend": "local"): the
+# weekly quartile series under train/ are forecast with the NumPy models of forecasters.py and
+# the next period's p50 is written to current/<date>.json, in the shape update-resources writes.
+# Model used when params.json has no "LocalForecast": {"Model": ...}, see forecasters.FORECASTERS
+MODEL = environ.get('LOCAL_FORECAST_MODEL', 'auto')
+FREQUENCY_DAYS = {'D': 1, 'W': 7}
+# Forecasts keep the raw data's price precision
+PRICE_DECIMALS = 6
+# Set to run against a local directory holding train/ instead of the bucket
+STORAGE = LocalStorage(environ['STORAGE_ROOT']) if environ.get('STORAGE_ROOT') else None
+
+
+def move_current(storage):
+    # Outdated forecasts go to history/clean/ like update-resources moves them
+    for key in storage.list('current'):
+        storage.write('history/clean/{}'.format(key.split('/')[1]), storage.read(key))
+        storage.delete(key)
+
+
+def run_forecast(storage, model=MODEL, frequency='W'):
+    # Forecast the period after the latest one in train/, returns the current/ key and the model of every item
+    if frequency not in FREQUENCY_DAYS:
+        raise ValueError(f"Unsupported forecast frequency {frequency}, expected one of {', '.join(FREQUENCY_DAYS)}")
+    step = timedelta(days=FREQUENCY_DAYS[frequency])
+    values = read_history(storage)
+    if not values:
+        raise ValueError(f'No training data under {TRAIN_PREFIX}/')
+    items, last, history = history_matrix(values, step)
+    started = time.perf_counter()
+    forecasts, models = forecast(history, 1, model)
+    print(f'Forecast {len(items)} items over {history.shape[1]} periods in {time.perf_counter() - started:.4f}s')
+    date = (last + step).strftime(ROW_DATE_FORMAT)
+    forecast_dict = {"Forecast": {"Date": date}}
+    forecast_dict["Forecast"].update(
+        {item: round(float(value), PRICE_DECIMALS) for item, value in zip(items, forecasts[:, 0])}
+    )
+    json_body = json.dumps(forecast_dict, indent=4, sort_keys=True)
+    print(json_body)
+    move_current(storage)
+    key = f'current/{date}.json'
+    storage.write(key, json_body)
+    return key, dict(zip(items, models))
+
+
+def lambda_handler(event, context):
+    params = event.get('params', {})
+    storage = STORAGE or S3Storage(event['bucket'])
+    model = params.get('LocalForecast', {}).get('Model', MODEL)
+    frequency = params.get('Predictor', {}).get('FeaturizationConfig', {}).get('ForecastFrequency', 'W')
+    key, models = run_forecast(storage, model, frequency)
+    event['LocalForecast'] = {'Key': key, 'Models': models}
+    return event
+
+
+if __name__ == "__main__":
+    # PYTHONPATH=shared/python python3 lambdas/localforecast/localforecast.py --root training
+    import argparse
+    parser = argparse.ArgumentParser(description="Forecast the next week of the quartile series under <root>/train")
+    parser.add_argument('--root', required=True, help='directory holding train/, current/ is written next to it')
+    parser.add_argument('--model', default=MODEL, help='auto, naive, seasonal_naive, exponential_smoothing or quantile_regression')
+    parser.add_argument('--frequency', default='W', help='forecast frequency, W or D')
+    args = parser.parse_args()
+    print(run_forecast(LocalStorage(args.root), args.model, args.frequency))
@@ -1,7 +1,7 @@
 import os
-from boto3 import client
+from clients import get_client
 
-SNS = client('sns')
+SNS = get_client('sns')
 
 def get_message(event):
     if 'statesError' in event.keys():
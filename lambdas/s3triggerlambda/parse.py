@@ -1,28 +1,76 @@
 import os
+import re
+import uuid
 from json import loads, dumps
 from datetime import datetime
-from boto3 import client
-# from jsonschema import validate
+from clients import get_client
 from schema import SCHEMA_DEF
+from validator import InvalidParams, compile_schema
 
-STEP_FUNCTIONS_CLI = client('stepfunctions')
+STEP_FUNCTIONS_CLI = get_client('stepfunctions')
+# Step Functions execution names are at most 80 letters, digits, - and _
+EXECUTION_NAME_LENGTH = 80
+VALIDATE_PARAMS = compile_schema(SCHEMA_DEF)
+# Validated params of warm invocations, {(bucket, key): (etag, params)}
+PARAMS_CACHE = {}
+
+
+def load_params(body, bucket_name, key_name):
+    params = loads(body.decode('utf-8'))
+    errors = VALIDATE_PARAMS(params)
+    if errors:
+        # Fail at the trigger, before the state machine creates any resources
+        raise InvalidParams(
+            's3://{bucket}/{key} is not valid: {errors}'.format(
+                bucket=bucket_name, key=key_name, errors='; '.join(errors)
+            )
+        )
+    return params
 
 
 def get_params(bucket_name, key_name):
-    params = loads(
-        client('s3').get_object(Bucket=bucket_name,
-                                Key=key_name)['Body'].read().decode('utf-8')
-    )
-    # validate(params, SCHEMA_DEF)
+    # The cached params are only downloaded again when the object's ETag changed,
+    # a conditional GET answers 304 Not Modified otherwise
+    s3 = get_client('s3')
+    cached = PARAMS_CACHE.get((bucket_name, key_name))
+    request = {'Bucket': bucket_name, 'Key': key_name}
+    if cached:
+        request['IfNoneMatch'] = cached[0]
+    try:
+        response = s3.get_object(**request)
+    except s3.exceptions.ClientError as e:
+        if cached and e.response.get('Error', {}).get('Code') in {'304', 'NotModified'}:
+            return cached[1]
+        raise
+    params = load_params(response['Body'].read(), bucket_name, key_name)
+    PARAMS_CACHE[(bucket_name, key_name)] = (response['ETag'], params)
     return params
 
 
+def execution_name(record):
+    # Unique per S3 event: time, the object's key and the event's sequencer (a uuid without one),
+    # events of the same second never collide with ExecutionAlreadyExists
+    s3_object = record['s3'].get('object', {})
+    suffix = s3_object.get('sequencer') or uuid.uuid4().hex
+    name = '{time}_{key}_{suffix}'.format(
+        time=datetime.now().strftime("%Y_%m_%d_%H_%M_%S"),
+        key=s3_object.get('key', ''),
+        suffix=suffix
+    )
+    name = re.sub(r'[^A-Za-z0-9_-]', '_', name)
+    # Keep the unique suffix when a long key has to be cut
+    if len(name) > EXECUTION_NAME_LENGTH:
+        name = name[:EXECUTION_NAME_LENGTH - len(suffix) - 1] + '_' + suffix
+    return name
+
+
 def lambda_handler(event, context):
-    bucket_name = event['Records'][0]['s3']['bucket']['name']
+    record = event['Records'][0]
+    bucket_name = record['s3']['bucket']['name']
     return dumps(
         STEP_FUNCTIONS_CLI.start_execution(
             stateMachineArn=os.environ['STEP_FUNCTIONS_ARN'],
-            name=datetime.now().strftime("%Y_%m_%d_%H_%M_%S"),
+            name=execution_name(record),
             input=dumps(
                 {
                     'bucket': bucket_name,
@@ -68,6 +68,19 @@ SCHEMA_DEF = {
             "TimestampFormat": {
                 "type": "string"
             },
+            "Backend": {
+                "type": "string",
+                "enum": ["forecast", "local"]
+            },
+            "LocalForecast":
+                {
+                    "type": "object",
+                    "properties": {
+                        "Model": {
+                            "type": "string"
+                        }
+                    }
+                },
             "Datasets":
                 {
                     "type":
@@ -0,0 +1,91 @@
+# Compiles the JSON Schema subset SCHEMA_DEF uses (type, enum, properties, required, items) into
+# nested closures once, at import, so validating params on every invocation only costs a
+# walk over the params themselves. Validators return a list of error messages, empty when
+# the document is valid.
+
+# bool is an int subclass in python, but not an integer or number in JSON Schema
+TYPE_CHECKS = {
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+    'string': lambda value: isinstance(value, str),
+    'integer': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'boolean': lambda value: isinstance(value, bool),
+    'null': lambda value: value is None,
+}
+
+
+class InvalidParams(ValueError):
+    pass
+
+
+def compile_schema(schema):
+    checks = []
+    if 'type' in schema:
+        expected = schema['type']
+        type_check = TYPE_CHECKS[expected]
+
+        def check_type(value, path):
+            if not type_check(value):
+                return [f'{path}: expected {expected}, got {type(value).__name__}']
+            return []
+        checks.append(check_type)
+    if 'enum' in schema:
+        allowed = list(schema['enum'])
+
+        def check_enum(value, path):
+            if value not in allowed:
+                return [f'{path}: {value!r} is not one of {", ".join(map(repr, allowed))}']
+            return []
+        checks.append(check_enum)
+    if 'required' in schema:
+        required = list(schema['required'])
+
+        def check_required(value, path):
+            if not isinstance(value, dict):
+                return []
+            return [f'{path}: {name!r} is required' for name in required if name not in value]
+        checks.append(check_required)
+    if 'properties' in schema:
+        properties = [(name, compile_schema(sub)) for name, sub in schema['properties'].items()]
+
+        def check_properties(value, path):
+            if not isinstance(value, dict):
+                return []
+            errors = []
+            for name, validate in properties:
+                if name in value:
+                    errors.extend(validate(value[name], f'{path}.{name}'))
+            return errors
+        checks.append(check_properties)
+    if 'items' in schema:
+        items = schema['items']
+        if isinstance(items, list):
+            # A list of schemas validates the array's items by position
+            positional = [compile_schema(sub) for sub in items]
+
+            def check_items(value, path):
+                if not isinstance(value, list):
+                    return []
+                errors = []
+                for i, (item, validate) in enumerate(zip(value, positional)):
+                    errors.extend(validate(item, f'{path}[{i}]'))
+                return errors
+        else:
+            validate_item = compile_schema(items)
+
+            def check_items(value, path):
+                if not isinstance(value, list):
+                    return []
+                errors = []
+                for i, item in enumerate(value):
+                    errors.extend(validate_item(item, f'{path}[{i}]'))
+                return errors
+        checks.append(check_items)
+
+    def validate(value, path='params'):
+        errors = []
+        for check in checks:
+            errors.extend(check(value, path))
+        return errors
+    return validate
@@ -1,13 +1,23 @@
 import re
-from datetime import datetime
+from os import environ
+from concurrent.futures import ThreadPoolExecutor
 import io
-from boto3 import client, resource
+from clients import get_client
 import pandas as pd
 import json
 
 
-S3_CLI = client('s3')
-S3 = resource('s3')
+# Objects are read and copied on this many threads, the client's connection pool matches it
+S3_WORKERS = int(environ.get('S3_WORKERS', 16))
+# delete_objects accepts at most 1000 keys per call
+DELETE_BATCH_SIZE = 1000
+# The only forecast export columns the output json needs
+FORECAST_COLUMNS = ['item_id', 'date', 'p50']
+
+
+# From the shared client cache, created on first use instead of at import
+def s3_client():
+    return get_client('s3', max_pool_connections=S3_WORKERS)
 
 
 def get_type_string(forecast_type):
@@ -17,77 +27,99 @@ def get_type_string(forecast_type):
         return forecast_type
 
 
-# Move an object within the specified bucket.
-def move_object(bucket, source, destination):
-    S3_CLI.copy_object(
+# Keys of every object under prefix, list_objects_v2 returns at most 1000 per call
+def list_keys(bucket, prefix):
+    keys = []
+    paginator = s3_client().get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []))
+    return keys
+
+
+def copy_object(bucket, source, destination):
+    s3_client().copy_object(
         Bucket=bucket,
         CopySource='{bucket}/{key}'.format(bucket=bucket, key=source),
         Key=destination
     )
-    S3_CLI.delete_object(Bucket=bucket, Key=source)
 
-def transform(bucket_name):
+
+# Delete keys with one delete_objects call per DELETE_BATCH_SIZE keys
+def delete_objects(bucket, keys):
+    for i in range(0, len(keys), DELETE_BATCH_SIZE):
+        response = s3_client().delete_objects(
+            Bucket=bucket,
+            Delete={
+                'Objects': [{'Key': key} for key in keys[i:i + DELETE_BATCH_SIZE]],
+                'Quiet': True
+            }
+        )
+        # Quiet mode only reports the keys that could not be deleted
+        errors = response.get('Errors', [])
+        if errors:
+            raise RuntimeError('Could not delete {count} objects, first: {key} ({message})'.format(
+                count=len(errors), key=errors[0].get('Key'), message=errors[0].get('Message')))
+
+
+# Move objects within the specified bucket: moves is a list of (source, destination) keys.
+# Every copy runs on the pool, sources are only deleted once all copies succeeded.
+def move_objects(pool, bucket, moves):
+    if not moves:
+        return
+    copies = [pool.submit(copy_object, bucket, source, destination) for source, destination in moves]
+    for copy in copies:
+        copy.result()
+    delete_objects(bucket, [source for source, _ in moves])
+
+
+def read_forecast_csv(bucket_name, key):
+    body = s3_client().get_object(Bucket=bucket_name, Key=key)['Body'].read()
+    return pd.read_csv(io.BytesIO(body), encoding='utf8', usecols=FORECAST_COLUMNS)
+
+
+def transform(pool, bucket_name, keys):
     # Transform forecast output to single, easily parseable, json file
-    Bucket = S3.Bucket(bucket_name)
-    prefix_df = []
-    prefix_objs = Bucket.objects.filter(Prefix="tmp/")
-    # Read through all csv files in tmp/ and concatenate them into a pandas df
-    for obj in prefix_objs:
-        key = obj.key
-        # Move on if not a csv file
-        if not key.endswith('.csv') and not key.endswith('.CSV'):
-            continue
-        body = obj.get()['Body'].read()
-        temp = pd.read_csv(io.BytesIO(body), encoding='utf8')        
-        prefix_df.append(temp)
+    # Read all csv files in tmp/ on the pool and concatenate them into a pandas df, in key order
+    csv_keys = [key for key in keys if key.endswith('.csv') or key.endswith('.CSV')]
+    prefix_df = list(pool.map(lambda key: read_forecast_csv(bucket_name, key), csv_keys))
     # Concatenate to new df object
     new_df = pd.concat(prefix_df)
     # Replace default index with item_id (q1, q2, q3, or max)
     new_df.set_index('item_id', inplace=True)
     # Forecast dictionary will conatain forecasted values
     forecast_dict = {"Forecast" : {}}
-    # Extract Y_M_D for file name from timestamp in forecasted data
-    date = f'{new_df.at["max", "date"]}'.split("T")[0]
+    # Extract Y_M_D for file name from timestamp in forecasted data (first max row, an item can span parts)
+    date = f'{new_df.loc[["max"], "date"].iloc[0]}'.split("T")[0]
 
     forecast_dict["Forecast"]["Date"] = date
-    # Iterate over the df rows, defining the quartiles with their predicted values
-    for item_id, row in new_df.iterrows():
-        forecast_dict["Forecast"][item_id] = row['p50']
+    # Define the quartiles with their predicted values, a later row of an item replaces an earlier one
+    forecast_dict["Forecast"].update(new_df['p50'].to_dict())
     # Dump dictionary into prettified json object and sort the keys
     json_body = json.dumps(forecast_dict, indent=4, sort_keys=True)
     # Define object key
     json_file_key = f'tmp/{date}.json'
 
-    S3_CLI.put_object(Body=json_body, Bucket=bucket_name, Key=json_file_key)
+    s3_client().put_object(Body=json_body, Bucket=bucket_name, Key=json_file_key)
     return json_file_key
 
 
 def lambda_handler(event, context):
-    outdated_objects = S3_CLI.list_objects_v2(
-        Bucket=event['bucket'], Prefix='current'
-    )
-    new_objects = S3_CLI.list_objects_v2(Bucket=event['bucket'], Prefix='tmp/')
-    if 'Contents' in outdated_objects.keys():
-        for key in [obj['Key'] for obj in outdated_objects['Contents']]:
-            move_object(
-                bucket=event['bucket'],
-                source=key,
-                destination='history/clean/{}'.format(key.split('/')[1])
-            )
-    if 'Contents' in new_objects.keys():
-        # transorm objects into json
-        current_fc_key = transform(event['bucket'])
-        for page, key in enumerate([obj['Key'] for obj in new_objects['Contents']]):
-            if re.match('^.*\.(csv|CSV)', key):
-                move_object(
-                    bucket=event['bucket'],
-                    source=key,
-                    destination='history/raw/{}'.format(key.split('/')[1])
-                )
-        move_object(
-            bucket=event['bucket'],
-            source=current_fc_key,
-            destination='current/{}'.format(current_fc_key.split('/')[1])
-        )
+    bucket = event['bucket']
+    outdated_keys = list_keys(bucket, 'current')
+    new_keys = list_keys(bucket, 'tmp/')
+    with ThreadPoolExecutor(max_workers=S3_WORKERS) as pool:
+        move_objects(pool, bucket, [
+            (key, 'history/clean/{}'.format(key.split('/')[1])) for key in outdated_keys
+        ])
+        if new_keys:
+            # transorm objects into json
+            current_fc_key = transform(pool, bucket, new_keys)
+            move_objects(pool, bucket, [
+                (key, 'history/raw/{}'.format(key.split('/')[1]))
+                for key in new_keys if re.match(r'^.*\.(csv|CSV)', key)
+            ])
+            move_objects(pool, bucket, [
+                (current_fc_key, 'current/{}'.format(current_fc_key.split('/')[1]))
+            ])
 
     return event
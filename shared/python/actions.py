@@ -18,3 +18,13 @@ def take_action_delete(status):
         raise ResourcePending
     raise ResourceFailed
 
+
+def wait_seconds(description, kind, estimator):
+    # For the long running resources: instead of raising ResourcePending, returns how
+    # many seconds the state machine should Wait before describing the resource again
+    # (estimator.py), or 0 once it is ACTIVE. Raises ResourceFailed like take_action.
+    if description['Status'] in {'CREATE_PENDING', 'CREATE_IN_PROGRESS'}:
+        return estimator.predict_wait(kind, description)
+    take_action(description['Status'])
+    estimator.record(kind, description)
+    return 0
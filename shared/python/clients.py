@@ -0,0 +1,44 @@
+import threading
+from os import environ
+
+# Process wide cache of boto3 clients, keyed by service, region and config overrides. A
+# lambda container keeps its clients (and their pooled, kept alive TLS connections) across
+# warm invocations, and every module asking for the same client gets the same object.
+# boto3 is only imported when the first client is created.
+MAX_POOL_CONNECTIONS = int(environ.get('AWS_MAX_POOL_CONNECTIONS', 16))
+CONNECT_TIMEOUT = int(environ.get('AWS_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = int(environ.get('AWS_READ_TIMEOUT', 60))
+# Adaptive mode adds client side rate limiting on throttling to the standard retries
+RETRIES = {'mode': 'adaptive', 'max_attempts': int(environ.get('AWS_MAX_ATTEMPTS', 5))}
+
+_CLIENTS = {}
+# Creating clients from the default session is not thread safe
+_LOCK = threading.Lock()
+
+
+def client_config(**overrides):
+    from botocore.config import Config
+    settings = dict(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        retries=RETRIES,
+        tcp_keepalive=True,
+    )
+    settings.update(overrides)
+    return Config(**settings)
+
+
+def get_client(service, region=None, **overrides):
+    # overrides are botocore Config settings, e.g. max_pool_connections=32 for a larger thread pool
+    region = region or environ.get('AWS_REGION') or environ.get('AWS_DEFAULT_REGION')
+    key = (service, region, repr(sorted(overrides.items())))
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                import boto3
+                client = boto3.client(service, region_name=region, config=client_config(**overrides))
+                _CLIENTS[key] = client
+    return client
@@ -0,0 +1,100 @@
+import json
+import math
+import datetime
+from os import environ
+from storage import LocalStorage, S3Storage
+
+# Predicts how long a pending Forecast resource (dataset import job, predictor, forecast,
+# forecast export job) still needs, so the state machine can Wait that long before the
+# lambda describes it again instead of polling on a fixed backoff. Predictions come from
+# the recorded durations of earlier resources of the same kind, kept in a small json
+# object next to the train data:
+# {"Predictor": [{"Arn": ..., "Created": "2021-08-16T05:12:09+00:00", "Seconds": 2712.4}, ...], ...}
+HISTORY_KEY = 'manifests/durations.json'
+# Durations kept per kind, the oldest are dropped
+HISTORY_SIZE = 20
+# Fewer recorded durations than this and the service's own estimate or PRIOR_SECONDS is used
+MIN_SAMPLES = 3
+# Typical durations in seconds, used until there is history
+PRIOR_SECONDS = {
+    'DatasetImportJob': 600,
+    'Predictor': 3600,
+    'Forecast': 1800,
+    'ForecastExportJob': 600,
+}
+DEFAULT_PRIOR = 600
+# Quantile of the comparable recorded runs aimed at, lower checks earlier at the cost of more invocations
+WAIT_QUANTILE = 0.5
+# Once a resource runs longer than expected it is checked again after this fraction of its age
+OVERRUN_FRACTION = 0.25
+MIN_WAIT = 10
+MAX_WAIT = 900
+
+_STORAGES = {}
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def for_bucket(bucket):
+    # Estimator over the bucket's duration history. The storage (and its s3 client) is kept for
+    # warm invocations, STORAGE_ROOT keeps the history in a local directory instead, as in the ETL.
+    if bucket not in _STORAGES:
+        root = environ.get('STORAGE_ROOT')
+        _STORAGES[bucket] = LocalStorage(root) if root else S3Storage(bucket)
+    return CompletionEstimator(_STORAGES[bucket])
+
+
+class CompletionEstimator:
+    def __init__(self, storage, key=HISTORY_KEY):
+        self.storage = storage
+        self.key = key
+        self._history = None
+
+    @property
+    def history(self):
+        if self._history is None:
+            try:
+                self._history = json.loads(self.storage.read(self.key))
+            except KeyError:
+                self._history = {}
+        return self._history
+
+    def durations(self, kind):
+        return [entry['Seconds'] for entry in self.history.get(kind, [])]
+
+    def record(self, kind, description):
+        # Record how long an ACTIVE resource took, once per resource. Predictors and forecasts
+        # are deleted and recreated under the same arn, so a resource is its arn and creation time.
+        entry = {
+            'Arn': description.get(f'{kind}Arn'),
+            'Created': description['CreationTime'].isoformat(),
+            'Seconds': round((description['LastModificationTime'] - description['CreationTime']).total_seconds(), 1)
+        }
+        entries = self.history.setdefault(kind, [])
+        if any(e['Arn'] == entry['Arn'] and e['Created'] == entry['Created'] for e in entries):
+            return
+        entries.append(entry)
+        del entries[:-HISTORY_SIZE]
+        self.storage.write(self.key, json.dumps(self.history, indent=4, sort_keys=True))
+
+    def expected_remaining(self, kind, elapsed, service_minutes=None):
+        durations = self.durations(kind)
+        if len(durations) >= MIN_SAMPLES:
+            # WAIT_QUANTILE of the recorded runs that took longer than this one has taken so far:
+            # the longer a resource has been pending, the longer the runs it is compared with
+            longer = sorted(seconds for seconds in durations if seconds > elapsed)
+            if longer:
+                return longer[int(len(longer) * WAIT_QUANTILE)] - elapsed
+            return elapsed * OVERRUN_FRACTION
+        if service_minutes is not None:
+            return service_minutes * 60
+        prior = PRIOR_SECONDS.get(kind, DEFAULT_PRIOR)
+        return prior - elapsed if prior > elapsed else elapsed * OVERRUN_FRACTION
+
+    def predict_wait(self, kind, description):
+        # Seconds to wait before describing the pending resource again
+        elapsed = max(0.0, (now() - description['CreationTime']).total_seconds())
+        remaining = self.expected_remaining(kind, elapsed, description.get('EstimatedTimeRemainingInMinutes'))
+        return int(min(MAX_WAIT, max(MIN_WAIT, math.ceil(remaining))))
@@ -1,8 +1,16 @@
 import logging
-from boto3 import client
+from clients import get_client
 
 class Loader: 
     def __init__(self): 
-        self.forecast_cli = client('forecast') 
+        # The forecast client is created on first use (and shared through clients.py), so
+        # constructing a Loader at import costs nothing at cold start
+        self._forecast_cli = None
         self.logger = logging.getLogger() 
-        self.logger.setLevel(logging.INFO) 
\ No newline at end of file
+        self.logger.setLevel(logging.INFO) 
+
+    @property
+    def forecast_cli(self):
+        if self._forecast_cli is None:
+            self._forecast_cli = get_client('forecast')
+        return self._forecast_cli
@@ -0,0 +1,104 @@
+import json
+import numpy as np
+from pricestats import QUARTILES, events_from_trans_raw, step_durations, weighted_quantiles
+
+# Exact, mergeable summary of a price step function: how long every price was in effect.
+# Spot prices move on a fixed 0.0001 tick, so a week of one series is a few hundred
+# {tick: duration} entries, yet every quantile the minute grid would give can be read back
+# exactly. Sketches of adjacent windows (e.g. the seven days of a week) merge by adding
+# their durations, so the week's quantiles never need the week's raw events again.
+# Serialized as {"unit": "m", "start": "...", "end": "...", "durations": {"5583": 720, ...}}
+TICKS_PER_DOLLAR = 10000
+
+
+def to_ticks(prices):
+    prices = np.asarray(prices, dtype=np.float64)
+    ticks = np.rint(prices * TICKS_PER_DOLLAR).astype(np.int64)
+    if not np.allclose(ticks / TICKS_PER_DOLLAR, prices, rtol=0, atol=1e-9):
+        raise ValueError(f"Price not on the 1/{TICKS_PER_DOLLAR} tick")
+    return ticks
+
+
+class PriceSketch:
+    def __init__(self, durations=None, start=None, end=None, unit='m'):
+        # durations is {tick: number of unit ticks in effect}, start and end the covered window
+        self.durations = dict(durations or {})
+        self.start = None if start is None else np.datetime64(start, unit)
+        self.end = None if end is None else np.datetime64(end, unit)
+        self.unit = unit
+
+    @classmethod
+    def from_events(cls, times, prices, start, end, unit='m'):
+        # Sketch of [start, end) from price change events sorted by time, the price in effect
+        # at start is the latest change at or before it (see pricestats.step_durations)
+        times = times.astype(f'datetime64[{unit}]')
+        if times.size == 0 or times[0] > np.datetime64(start, unit):
+            raise ValueError("No price in effect at start of window")
+        durations = step_durations(times, start, end, unit)
+        ticks = to_ticks(prices)
+        in_effect = durations > 0
+        unique, inverse = np.unique(ticks[in_effect], return_inverse=True)
+        totals = np.bincount(inverse, weights=durations[in_effect]).astype(np.int64)
+        return cls(dict(zip(unique.tolist(), totals.tolist())), start, end, unit)
+
+    @classmethod
+    def from_trans_raw(cls, tr_dict, start, end, unit='m'):
+        # Sketch of the {timestamp: price} dict generateTransRaw builds
+        times, prices = events_from_trans_raw(tr_dict, unit)
+        return cls.from_events(times, prices, start, end, unit)
+
+    @classmethod
+    def merge_all(cls, sketches):
+        sketches = list(sketches)
+        merged = cls(unit=sketches[0].unit)
+        for sketch in sketches:
+            merged.merge(sketch)
+        return merged
+
+    def merge(self, other):
+        # Add other's durations in place, the covered window grows to span both
+        if other.unit != self.unit:
+            raise ValueError(f"Cannot merge a sketch in {other.unit} into one in {self.unit}")
+        for tick, duration in other.durations.items():
+            self.durations[tick] = self.durations.get(tick, 0) + duration
+        if other.start is not None:
+            self.start = other.start if self.start is None else min(self.start, other.start)
+            self.end = other.end if self.end is None else max(self.end, other.end)
+        return self
+
+    def total(self):
+        return sum(self.durations.values())
+
+    def is_complete(self):
+        # True when the durations cover every unit of [start, end), i.e. no partial is missing
+        return self.start is not None and self.total() == int((self.end - self.start).astype(np.int64))
+
+    def arrays(self):
+        ticks = np.array(sorted(self.durations), dtype=np.int64)
+        weights = np.array([self.durations[tick] for tick in ticks.tolist()], dtype=np.int64)
+        return ticks / TICKS_PER_DOLLAR, weights
+
+    def quantiles(self, quantiles=QUARTILES):
+        # Same values np.quantile gives over the window expanded to one price per unit
+        prices, weights = self.arrays()
+        return weighted_quantiles(prices, weights, quantiles)
+
+    def max(self):
+        return max(self.durations) / TICKS_PER_DOLLAR
+
+    def min(self):
+        return min(self.durations) / TICKS_PER_DOLLAR
+
+    def to_json(self):
+        return json.dumps({
+            'unit': self.unit,
+            'start': None if self.start is None else str(self.start),
+            'end': None if self.end is None else str(self.end),
+            'durations': {str(tick): duration for tick, duration in sorted(self.durations.items())},
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        durations = {int(tick): duration for tick, duration in data['durations'].items()}
+        return cls(durations, data['start'], data['end'], data['unit'])
@@ -0,0 +1,158 @@
+import datetime
+import numpy as np
+
+# A spot price is a step function: each (timestamp, price) change event holds
+# its price until the next change. The functions below weight every price by
+# how long it was in effect, so statistics are computed from the change events
+# alone and never from a per-minute (or per-second) expansion of the window.
+
+QUARTILES = (0.25, 0.5, 0.75)
+# Length of "YYYY-MM-DD HH:MM:SS", anything after it is a utc offset
+NAIVE_ISO_LENGTH = 19
+
+
+def parse_timestamps(raw_times):
+    # Parse the raw records' timestamps as one datetime64[s] array of utc times. Accepts the
+    # timezone aware datetimes boto3 returns and the iso strings stored under Data/Raw
+    # ("2021-06-21 22:42:18+00:00"), neither is modified.
+    raw_times = list(raw_times)
+    if not raw_times:
+        return np.array([], dtype='datetime64[s]')
+    if isinstance(raw_times[0], datetime.datetime):
+        if raw_times[0].tzinfo is None:
+            return np.array(raw_times, dtype='datetime64[s]')
+        # numpy has no timezones, aware datetimes go through their posix timestamps
+        return np.array([t.timestamp() for t in raw_times], dtype=np.int64).astype('datetime64[s]')
+    text = np.asarray(raw_times, dtype=str)
+    times = text.astype(f'U{NAIVE_ISO_LENGTH}').astype('datetime64[s]')
+    # The api only ever reports utc, any other offset is converted one string at a time
+    utc = (np.char.str_len(text) == NAIVE_ISO_LENGTH) | np.char.endswith(text, '+00:00') | np.char.endswith(text, 'Z')
+    for i in np.flatnonzero(~utc):
+        aware = datetime.datetime.fromisoformat(str(text[i]))
+        times[i] = np.datetime64(aware.astimezone(datetime.timezone.utc).replace(tzinfo=None), 's')
+    return times
+
+
+def normalize_timestamps(raw_times, start, round_to_minute=True):
+    # Changes prior to start are moved to start, changes that occur mid minute are
+    # moved up to the top of the next minute unless second resolution is requested
+    times = parse_timestamps(raw_times)
+    start = np.datetime64(start, 's')
+    if round_to_minute:
+        rounded = (times + np.timedelta64(59, 's')).astype('datetime64[m]').astype('datetime64[s]')
+    else:
+        rounded = times
+    return np.where(times < start, start, rounded)
+
+
+def events_from_trans_raw(tr_dict, unit='s'):
+    # Convert the {timestamp string: price string} dict from generateTransRaw into
+    # parallel datetime64/float64 arrays sorted by time
+    times = np.array(list(tr_dict.keys()), dtype=f'datetime64[{unit}]')
+    prices = np.array(list(tr_dict.values()), dtype=np.float64)
+    order = np.argsort(times, kind='stable')
+    return times[order], prices[order]
+
+
+def step_durations(times, start, end, unit='s'):
+    # Number of <unit> ticks each price was in effect within [start, end).
+    # Changes prior to start are clamped to start, so only the last of them
+    # carries any weight, and changes at or after end carry none.
+    start = np.datetime64(start, unit)
+    end = np.datetime64(end, unit)
+    clamped = np.minimum(np.maximum(times.astype(f'datetime64[{unit}]'), start), end)
+    following = np.append(clamped[1:], end)
+    return (following - clamped).astype(np.int64)
+
+
+def weighted_quantiles(values, weights, quantiles):
+    # Quantiles of values repeated weights times, using the same linear
+    # interpolation as np.quantile but without materializing the repeats.
+    order = np.argsort(values, kind='stable')
+    values = values[order]
+    weights = weights[order]
+    cumulative = np.cumsum(weights)
+    total = cumulative[-1]
+    # Virtual index into the expanded array, split into its integer and fractional parts
+    virtual = (total - 1) * np.asarray(quantiles, dtype=np.float64)
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    previous = previous.astype(np.int64)
+    following = np.minimum(previous + 1, total - 1)
+    # The expanded array's k-th element is the value whose cumulative weight first exceeds k
+    a = values[np.searchsorted(cumulative, previous, side='right')]
+    b = values[np.searchsorted(cumulative, following, side='right')]
+    diff = b - a
+    return np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+
+
+def duration_weighted_stats(times, prices, start, end, quantiles=QUARTILES, unit='s'):
+    # Exact duration weighted min, max, mean and quantiles of a price step function
+    # over [start, end), at the resolution given by unit
+    if times.size == 0 or times.astype(f'datetime64[{unit}]')[0] > np.datetime64(start, unit):
+        raise ValueError("No price in effect at start of window")
+    durations = step_durations(times, start, end, unit)
+    in_effect = durations > 0
+    prices = np.asarray(prices, dtype=np.float64)[in_effect]
+    durations = durations[in_effect]
+    return {
+        "min": prices.min(),
+        "max": prices.max(),
+        "mean": np.dot(prices, durations) / durations.sum(),
+        "quantiles": weighted_quantiles(prices, durations, quantiles),
+        "duration": durations.sum(),
+    }
+
+
+def rollup(times, prices, start, end, period, quantiles=QUARTILES, unit='s'):
+    # Duration weighted statistics of a price step function for every period long
+    # bucket of [start, end). The step segments are split at bucket edges and put
+    # through a single (bucket, price) sort, every statistic is then read off the
+    # sorted segments for all buckets at once.
+    times = times.astype(f'datetime64[{unit}]')
+    prices = np.asarray(prices, dtype=np.float64)
+    start = np.datetime64(start, unit)
+    end = np.datetime64(end, unit)
+    if times.size == 0 or times[0] > start:
+        raise ValueError("No price in effect at start of window")
+    bucket_starts = np.arange(start, end, np.timedelta64(period, unit))
+    edges = np.append(bucket_starts, end)
+    # Segments run between consecutive price changes or bucket edges. The price in
+    # effect at start is carried in, it is not counted as a change of the window
+    changed = times[(times > start) & (times < end)]
+    breaks = np.union1d(changed, edges)
+    seg_start = breaks[:-1]
+    seg_duration = np.diff(breaks).astype(np.int64)
+    seg_price = prices[np.searchsorted(times, seg_start, side='right') - 1]
+    seg_bucket = np.searchsorted(edges, seg_start, side='right') - 1
+    # One sort orders segments by bucket, then by price within each bucket
+    order = np.lexsort((seg_price, seg_bucket))
+    price = seg_price[order]
+    duration = seg_duration[order]
+    bucket = seg_bucket[order]
+    first = np.searchsorted(bucket, np.arange(bucket_starts.size))
+    last = np.append(first[1:], price.size) - 1
+    total = np.add.reduceat(duration, first)
+    mean = np.add.reduceat(price * duration, first) / total
+    variance = np.add.reduceat(duration * (price - mean[bucket]) ** 2, first) / total
+    # Weighted quantiles per bucket, indexing into the bucket's run of the global cumulative weight
+    cumulative = np.cumsum(duration)
+    offset = cumulative[first] - duration[first]
+    virtual = (total - 1) * np.asarray(quantiles, dtype=np.float64)[:, None]
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    previous = previous.astype(np.int64)
+    following = np.minimum(previous + 1, total - 1)
+    a = price[np.searchsorted(cumulative, offset + previous, side='right')]
+    b = price[np.searchsorted(cumulative, offset + following, side='right')]
+    diff = b - a
+    return {
+        "start": bucket_starts,
+        "quantiles": np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma),
+        "min": price[first],
+        "max": price[last],
+        "mean": mean,
+        "std": np.sqrt(variance),
+        "changes": np.diff(np.searchsorted(changed, edges, side='left')),
+        "duration": total,
+    }
@@ -0,0 +1,156 @@
+import datetime
+import numpy as np
+from pricestats import QUARTILES, events_from_trans_raw, duration_weighted_stats, normalize_timestamps
+
+# Transform core shared by the ETL lambda and the Scripts/Transforming tools: raw spot
+# price records -> price change events (the tr dict) -> per-minute series and weekly
+# quartiles -> headerless csv text. Nothing here reads or writes storage.
+
+FILE_NAME_TIME_FORMAT = "%Y_%m_%d"
+DATA_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+TS = "Timestamp"
+C4 = "c4.8xlarge"
+PRICE_FORMAT = "%.6f"
+MINUTES_IN_DAY = 60 * 24
+DAYS_IN_WEEK = 7
+
+
+def buildTransRaw(timestamps, prices, startDate, roundToMinute=True):
+    # Build the tr dict of {timestamp string: price} from parallel lists of raw timestamps and prices.
+    # All timestamps are normalized as one array, a later record for the same timestamp replaces an earlier one.
+    times = normalize_timestamps(timestamps, startDate, roundToMinute)
+    keys = np.char.replace(np.datetime_as_string(times, unit='s'), 'T', ' ')
+    return dict(zip(keys.tolist(), prices))
+
+def generateTransRaw(rawData, startDate, roundToMinute=True):
+    # Raw data is a list of json objects represting price and time of price change.
+    # Some data may include instance types other than c4.8xlarge, if so skip it
+    timestamps, prices = [], []
+    for elm in rawData:
+        if elm["InstanceType"] != C4:
+            continue
+        timestamps.append(elm[TS])
+        prices.append(elm.get('SpotPrice'))
+    return buildTransRaw(timestamps, prices, startDate, roundToMinute)
+
+def seriesOf(elm):
+    return (elm["InstanceType"], elm["AvailabilityZone"], elm["ProductDescription"])
+
+def seriesLabel(series):
+    # File system and S3 safe name of a series, e.g. c4.8xlarge_us-west-2a_Linux-UNIX
+    return '_'.join(series).replace('/', '-').replace(' ', '-')
+
+def generateTransRawBySeries(rawData, startDate, roundToMinute=True):
+    # One pass over the raw data that partitions the records by series, building a tr dict
+    # (as generateTransRaw does) for every series found. Only the timestamp and price of
+    # each record are kept, so the records themselves can be dropped as they stream past.
+    eventsBySeries = {}
+    for elm in rawData:
+        timestamps, prices = eventsBySeries.setdefault(seriesOf(elm), ([], []))
+        timestamps.append(elm[TS])
+        prices.append(elm.get('SpotPrice'))
+    return {
+        series: buildTransRaw(timestamps, prices, startDate, roundToMinute)
+        for series, (timestamps, prices) in eventsBySeries.items()
+    }
+
+def resampleToMinuteGrid(starting_dt, tr_dict, days=DAYS_IN_WEEK):
+    # Price change events as parallel datetime64/float arrays, sorted by time
+    eventTimes = np.array(list(tr_dict.keys()), dtype='datetime64[m]')
+    eventPrices = np.array(list(tr_dict.values()), dtype=np.float64)
+    order = np.argsort(eventTimes, kind='stable')
+    eventTimes = eventTimes[order]
+    eventPrices = eventPrices[order]
+    # One grid point for every minute of the window
+    grid = np.datetime64(starting_dt, 'm') + np.arange(days * MINUTES_IN_DAY)
+    # Index of the latest price change at or before each grid point, this forward fills the price
+    idx = np.searchsorted(eventTimes, grid, side='right') - 1
+    # Quick sanity check for error, the first minute must have a price
+    if idx.size == 0 or idx[0] < 0:
+        print("Big Problem")
+        raise NameError("No Price")
+    # Return the minute grid and the price in effect at every minute
+    return grid, eventPrices[idx]
+
+def transformDataToDict(starting_dt, tr_dict, instanceType=C4, days=DAYS_IN_WEEK):
+    # Resample price change events onto the minute grid
+    grid, prices = resampleToMinuteGrid(starting_dt, tr_dict, days)
+    # Instance type (id) is a single label for the whole series, the csv writer repeats it per row
+    return {TS: grid, "SpotPrice": prices, "InstanceType": instanceType}
+
+def transformFromMinIncrementToWeeklyQuartiles(minuteIncDict):
+    # Clean up time stamp
+    ts = str(np.datetime64(minuteIncDict[TS][0], 'D'))
+    # Instantiate a dictionary to track quartiles
+    quartDict = {TS : [ts]*4}
+    # Instantiate a float64 numpy array of the SpotPrice column of the minuteIncDict
+    conv_priceList = np.asarray(minuteIncDict['SpotPrice'], dtype=np.float64)
+    # Retrieve the first 3 quartiles in one pass, and max value of the SpotPrice values of the numpy array
+    q1, q2, q3 = np.quantile(conv_priceList, QUARTILES)
+    max = np.max(conv_priceList)
+    # Assign the quartiles and quartile IDs as lists to dictionary keys
+    quartDict['SpotPrice'] = [q1, q2, q3, max]
+    quartDict['q_id'] = ['q1', 'q2', 'q3', 'max']
+    # Return the quartile dictionary
+    return quartDict
+
+def transformMinuteMatrixToWeeklyQuartiles(startDates, priceMatrix):
+    # priceMatrix holds one week of minute prices per row, every week's quartiles
+    # come from a single np.quantile call along the minute axis
+    quartiles = np.quantile(priceMatrix, QUARTILES, axis=1)
+    maxes = np.max(priceMatrix, axis=1)
+    quartDicts = []
+    for i, startDate in enumerate(startDates):
+        ts = startDate.strftime('%Y-%m-%d')
+        quartDicts.append({
+            TS: [ts]*4,
+            'SpotPrice': [quartiles[0, i], quartiles[1, i], quartiles[2, i], maxes[i]],
+            'q_id': ['q1', 'q2', 'q3', 'max']
+        })
+    return quartDicts
+
+def transformEventsToWeeklyQuartiles(starting_dt, tr_dict, days=DAYS_IN_WEEK, unit='m'):
+    # Same quartile record as transformFromMinIncrementToWeeklyQuartiles, but duration weighted
+    # from the price change events so the window is never expanded to one row per minute.
+    # unit='m' matches the minute grid, unit='s' works on events from generateTransRaw(roundToMinute=False)
+    times, prices = events_from_trans_raw(tr_dict, unit)
+    end = starting_dt + datetime.timedelta(days=days)
+    stats = duration_weighted_stats(times, prices, starting_dt, end, QUARTILES, unit)
+    ts = starting_dt.strftime('%Y-%m-%d')
+    return {
+        TS: [ts]*4,
+        'SpotPrice': [*stats['quantiles'], stats['max']],
+        'q_id': ['q1', 'q2', 'q3', 'max']
+    }
+
+def transformSketchToWeeklyQuartiles(starting_dt, sketch):
+    # Same quartile record as transformEventsToWeeklyQuartiles, read off a (merged) PriceSketch
+    ts = starting_dt.strftime('%Y-%m-%d')
+    return {
+        TS: [ts]*4,
+        'SpotPrice': [*sketch.quantiles(QUARTILES), sketch.max()],
+        'q_id': ['q1', 'q2', 'q3', 'max']
+    }
+
+def csv_column(column, rows, float_format=None):
+    # One column as a list of strings, formatted the way DataFrame.to_csv formats it
+    if isinstance(column, str):
+        # A single label is repeated on every row
+        return [column] * rows
+    column = np.asarray(column)
+    if np.issubdtype(column.dtype, np.datetime64):
+        return [text.replace('T', ' ') for text in np.datetime_as_string(column, unit='s').tolist()]
+    if np.issubdtype(column.dtype, np.floating):
+        if float_format:
+            return [float_format % value for value in column.tolist()]
+        # Shortest repr that round trips, as pandas writes floats by default
+        return [repr(value) for value in column.tolist()]
+    return [str(value) for value in column.tolist()]
+
+def dict_to_csv(data, float_format=None):
+    # Headerless csv of a dict of columns, giving the same text as
+    # DataFrame(data).set_index(TS).to_csv(header=False) without pandas.
+    # Note: datetime columns always carry the time of day, pandas would drop it for all midnight columns.
+    rows = max(len(column) for column in data.values() if not isinstance(column, str))
+    columns = [csv_column(column, rows, float_format) for column in data.values()]
+    return '\n'.join(map(','.join, zip(*columns))) + '\n'
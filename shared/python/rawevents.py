@@ -0,0 +1,98 @@
+import gzip
+import json
+import datetime
+
+# Raw spot price events are stored as gzip compressed NDJSON, one compact json object per
+# line holding only the fields the pipeline reads, in a fixed order:
+# {"Timestamp":"2021-06-21 22:42:18+00:00","SpotPrice":"0.558300","InstanceType":"c4.8xlarge",...}
+# A file is read line by line, so it never has to fit in memory, and lines of other series
+# can be skipped without parsing them.
+RAW_FIELDS = ("Timestamp", "SpotPrice", "InstanceType", "AvailabilityZone", "ProductDescription")
+RAW_EXTENSION = "ndjson.gz"
+# Raw files written before this format are indented json arrays
+LEGACY_EXTENSION = "json"
+COMPRESS_LEVEL = 6
+# Records logged in full at the start of a stream, everything after is only summarized
+LOG_SAMPLE_SIZE = 3
+
+
+def compact_record(record):
+    # Only the pipeline's fields, timestamps as the iso text str() gives a datetime
+    compact = {}
+    for field in RAW_FIELDS:
+        value = record.get(field)
+        compact[field] = str(value) if isinstance(value, datetime.datetime) else value
+    return compact
+
+
+def encode_record(record):
+    return json.dumps(compact_record(record), separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def series_of(record):
+    return (record["InstanceType"], record["AvailabilityZone"], record["ProductDescription"])
+
+
+def open_raw_writer(fileobj):
+    # gzip stream over fileobj, mtime is fixed so the same records always give the same bytes
+    return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=COMPRESS_LEVEL, mtime=0)
+
+
+def iter_raw_events(fileobj, series=None):
+    # Stream the records of a gzip NDJSON file object, optionally only those of the given
+    # series, an iterable of (InstanceType, AvailabilityZone, ProductDescription) tuples.
+    # Every field is written in a fixed form, so a line that does not contain a wanted
+    # instance type is dropped before it is parsed.
+    wanted = None if series is None else set(series)
+    needles = None if wanted is None else [
+        json.dumps({"InstanceType": instance_type}, separators=(',', ':'))[1:-1].encode('utf-8')
+        for instance_type in {instance_type for instance_type, _, _ in wanted}
+    ]
+    with gzip.GzipFile(fileobj=fileobj, mode='rb') as gz:
+        for line in gz:
+            if needles is not None and not any(needle in line for needle in needles):
+                continue
+            record = json.loads(line)
+            if wanted is None or series_of(record) in wanted:
+                yield record
+
+
+def read_raw_events(storage, key, series=None):
+    # Stream the records of a raw object from the pipeline's storage (storage.py), in either
+    # format. Legacy json arrays cannot be streamed and are loaded whole.
+    if key.endswith(f'.{LEGACY_EXTENSION}'):
+        wanted = None if series is None else set(series)
+        records = json.loads(storage.read(key))
+        return (record for record in records if wanted is None or series_of(record) in wanted)
+    return _iter_raw_object(storage, key, series)
+
+
+def _iter_raw_object(storage, key, series):
+    body = storage.open(key)
+    try:
+        yield from iter_raw_events(body, series)
+    finally:
+        body.close()
+
+
+class RawEventSummary:
+    # Running summary of a record stream, logged in place of the records themselves:
+    # the first few records in full, then counts and time span per series
+    def __init__(self, sample_size=LOG_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.count = 0
+        self.by_series = {}
+
+    def add(self, record):
+        if self.count < self.sample_size:
+            print(f'Raw record {self.count}: {json.dumps(compact_record(record))}')
+        self.count += 1
+        timestamp = str(record["Timestamp"])
+        entry = self.by_series.setdefault(series_of(record), [0, timestamp, timestamp])
+        entry[0] += 1
+        entry[1] = min(entry[1], timestamp)
+        entry[2] = max(entry[2], timestamp)
+
+    def log(self):
+        for series, (count, first, last) in sorted(self.by_series.items()):
+            print(f'Raw {"/".join(series)}: {count} records, {first} - {last}')
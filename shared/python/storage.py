@@ -0,0 +1,129 @@
+import os
+
+# Where the pipeline reads and writes its objects. Keys are '/' separated paths relative to
+# the store (e.g. transformed/weekly/minute/2021_06_21.csv), so the same code runs against
+# the S3 bucket in the lambda and against a local directory (e.g. Data/) for development
+# and bulk reprocessing. Bodies are str, bytes or binary file objects.
+
+
+class Storage:
+    def read(self, key):
+        # Whole object as bytes, KeyError when there is no such key
+        raise NotImplementedError
+
+    def open(self, key):
+        # Binary file object for streaming reads, KeyError when there is no such key
+        raise NotImplementedError
+
+    def write(self, key, body):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def list(self, prefix=''):
+        # Sorted keys starting with prefix
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def read(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+    def open(self, key):
+        try:
+            return open(self.path(key), 'rb')
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def write(self, key, body):
+        # Written under a temporary name and moved into place, readers never see a partial file.
+        # Imported here, the lambda only writes locally when STORAGE_ROOT is set
+        import shutil
+        import tempfile
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, part_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if hasattr(body, 'read'):
+                    shutil.copyfileobj(body, f)
+                else:
+                    f.write(body.encode('utf-8') if isinstance(body, str) else body)
+            os.replace(part_path, path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def list(self, prefix=''):
+        keys = []
+        for current_dir, _, files in os.walk(self.root):
+            relative = os.path.relpath(current_dir, self.root)
+            for name in files:
+                key = name if relative == '.' else '/'.join(relative.split(os.sep) + [name])
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+
+class S3Storage(Storage):
+    def __init__(self, bucket, client=None):
+        # client is a boto3 s3 client, a function returning one, or None for the shared one (clients.py)
+        self.bucket = bucket
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from clients import get_client
+            self._client = get_client('s3')
+        return self._client() if callable(self._client) else self._client
+
+    def read(self, key):
+        body = self.open(key)
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def open(self, key):
+        client = self.client
+        try:
+            return client.get_object(Bucket=self.bucket, Key=key)['Body']
+        except client.exceptions.NoSuchKey:
+            raise KeyError(key)
+
+    def write(self, key, body):
+        self.client.put_object(Body=body, Bucket=self.bucket, Key=key)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def exists(self, key):
+        return any(k == key for k in self.list(key))
+
+    def list(self, prefix=''):
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return sorted(keys)
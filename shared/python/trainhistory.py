@@ -0,0 +1,49 @@
+from datetime import datetime
+import numpy as np
+
+# Reads the quartile training data (rows of timestamp,target_value,item_id under train/, the
+# layout Forecast imports) back into one (items, periods) array for in-process forecasting
+# and backtesting. Works against any storage (storage.py), the bucket or a local directory.
+TRAIN_PREFIX = 'train'
+ROW_DATE_FORMAT = '%Y-%m-%d'
+
+
+def read_history(storage, prefix=TRAIN_PREFIX):
+    # {item_id: {date: value}} of every csv under train/. Objects are read in key order and a
+    # later row of the same date and item replaces an earlier one, header rows are skipped.
+    values = {}
+    for key in storage.list(f'{prefix}/'):
+        if not key.lower().endswith('.csv'):
+            continue
+        for line in storage.read(key).decode('utf-8').splitlines():
+            fields = line.split(',')
+            if len(fields) != 3:
+                continue
+            try:
+                date = datetime.strptime(fields[0], ROW_DATE_FORMAT)
+                value = float(fields[1])
+            except ValueError:
+                continue
+            values.setdefault(fields[2], {})[date] = value
+    return values
+
+
+def history_matrix(values, step):
+    # Items, the latest date and the (items, periods) array over every period from the first to
+    # the last date. A period an item has no value for takes the previous period's value (the
+    # first known one at the start).
+    items = sorted(values)
+    dates = set().union(*values.values())
+    first, last = min(dates), max(dates)
+    periods = (last - first) // step + 1
+    matrix = np.full((len(items), periods), np.nan)
+    for row, item in enumerate(items):
+        for date, value in values[item].items():
+            matrix[row, (date - first) // step] = value
+    for t in range(1, periods):
+        missing = np.isnan(matrix[:, t])
+        matrix[missing, t] = matrix[missing, t - 1]
+    for row in range(len(items)):
+        known = matrix[row][~np.isnan(matrix[row])]
+        matrix[row, np.isnan(matrix[row])] = known[0]
+    return items, last, matrix
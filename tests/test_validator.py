@@ -0,0 +1,32 @@
+import os
+import sys
+import json
+
+ROOT_OF_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_OF_REPO, "lambdas", "s3triggerlambda"))
+from schema import SCHEMA_DEF
+from validator import compile_schema
+
+VALIDATE_PARAMS = compile_schema(SCHEMA_DEF)
+
+
+def load_params():
+    with open(os.path.join(ROOT_OF_REPO, "training", "params.json")) as f:
+        return json.load(f)
+
+
+def test_checked_in_params_are_valid():
+    assert VALIDATE_PARAMS(load_params()) == []
+
+
+def test_known_backends_are_valid():
+    params = load_params()
+    for backend in ("forecast", "local"):
+        params["Backend"] = backend
+        assert VALIDATE_PARAMS(params) == []
+
+
+def test_misspelled_backend_is_rejected():
+    params = load_params()
+    params["Backend"] = "locl"
+    assert VALIDATE_PARAMS(params) == ["params.Backend: 'locl' is not one of 'forecast', 'local'"]